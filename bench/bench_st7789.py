@@ -0,0 +1,237 @@
+# Copyright (c) 2020 Sebastian Wicki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Benchmark for the ST7789 driver running on CPython.
+
+The MicroPython modules used by the driver are replaced with minimal stand-ins
+and the display is replaced with a recording SPI bus and pins. For each
+drawing primitive and buffer size, the number of SPI transactions, bytes
+sent, DC and CS toggles and the peak memory allocated are reported. Only the
+pixel data produced by the stand-in framebuf module is fake, all counts
+reflect what the driver would send to a real display.
+
+    python3 bench/bench_st7789.py
+    python3 bench/bench_st7789.py --save baseline.json
+    python3 bench/bench_st7789.py --compare baseline.json
+
+With --compare, the exit status is non-zero if any count increased.
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+import tracemalloc
+import types
+
+BUF_SIZES = (128, 512, 2048, 8192)
+METRICS = ("spi", "bytes", "dc", "cs", "alloc")
+
+WIDTH = 135
+HEIGHT = 240
+
+_RGB565 = 1
+
+
+class Pin:
+    """Output pin counting its level changes."""
+
+    def __init__(self):
+        self.level = 1
+        self.toggles = 0
+
+    def on(self):
+        if not self.level:
+            self.toggles += 1
+        self.level = 1
+
+    def off(self):
+        if self.level:
+            self.toggles += 1
+        self.level = 0
+
+
+class SPI:
+    """SPI bus counting transactions and bytes."""
+
+    def __init__(self):
+        self.writes = 0
+        self.bytes = 0
+
+    def write(self, data):
+        self.writes += 1
+        self.bytes += len(data)
+
+
+class FrameBuffer:
+    """Subset of framebuf.FrameBuffer used by the driver."""
+
+    def __init__(self, buf, width, height, fmt):
+        self.buf = buf
+        self.width = width
+        self.height = height
+        self.fmt = fmt
+
+    def pixel(self, x, y, c):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            if self.fmt == _RGB565:
+                i = (y * self.width + x) * 2
+                self.buf[i] = c & 0xff
+                self.buf[i + 1] = c >> 8 & 0xff
+            else:
+                i = y * ((self.width + 7) // 8) + x // 8
+                self.buf[i] |= 0x80 >> x % 8
+
+    def fill_rect(self, x, y, w, h, c):
+        # pixel by pixel, so the stand-in itself does not allocate memory
+        x0, x1 = max(x, 0), min(x + w, self.width)
+        for row in range(max(y, 0), min(y + h, self.height)):
+            for col in range(x0, x1):
+                self.pixel(col, row, c)
+
+    def fill(self, c):
+        self.fill_rect(0, 0, self.width, self.height, c)
+
+    def text(self, s, x, y, c=1):
+        # a fixed pattern instead of the real font, good enough for counting
+        for i in range(len(s)):
+            for row in range(1, 7):
+                self.pixel(x + i * 8 + row, y + row, c)
+
+
+def _install_modules():
+    """Registers stand-ins for the MicroPython modules used by the driver."""
+    micropython = types.ModuleType("micropython")
+    micropython.const = lambda x: x
+    framebuf = types.ModuleType("framebuf")
+    framebuf.FrameBuffer = FrameBuffer
+    framebuf.MONO_HLSB = 3
+    framebuf.RGB565 = _RGB565
+    utime = types.ModuleType("utime")
+    utime.sleep_ms = lambda ms: None
+    utime.ticks_ms = lambda: int(time.monotonic() * 1000)
+    utime.ticks_diff = lambda a, b: a - b
+    sys.modules.setdefault("micropython", micropython)
+    sys.modules.setdefault("framebuf", framebuf)
+    sys.modules.setdefault("ustruct", struct)
+    sys.modules.setdefault("utime", utime)
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib"))
+
+
+IMAGE = bytes(range(256)) * (64 * 64 * 2 // 256)
+
+PRIMITIVES = (
+    ("fill", lambda t: t.fill(0x1234)),
+    ("fill_rect", lambda t: t.fill_rect(10, 20, 40, 30, 0x1234)),
+    ("text", lambda t: t.text("Hello World", 10, 20, 0xffff, 0x0000)),
+    ("text_x2", lambda t: t.text("Hello", 10, 20, 0xffff, 0x0000, scale=2)),
+    ("line", lambda t: t.line(0, 0, WIDTH - 1, HEIGHT - 1, 0x1234)),
+    ("hline", lambda t: t.hline(0, 10, WIDTH, 0x1234)),
+    ("pixel", lambda t: t.pixel(10, 20, 0x1234)),
+    ("blit_buffer", lambda t: t.blit_buffer(IMAGE, 10, 20, 64, 64)),
+)
+
+
+def measure(st7789, buf_size, func):
+    spi, dc, cs = SPI(), Pin(), Pin()
+    tft = st7789.ST7789(spi, WIDTH, HEIGHT, reset=Pin(), dc=dc, cs=cs,
+                        buf=bytearray(buf_size), init=False)
+    # warm up caches, e.g. the glyph cache, so the steady state is measured
+    func(tft)
+    tft.set_window(0, 0, 0, 0)
+    tft.cs_high()
+    spi.writes = spi.bytes = dc.toggles = cs.toggles = 0
+
+    tracemalloc.start()
+    func(tft)
+    alloc = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"spi": spi.writes, "bytes": spi.bytes, "dc": dc.toggles,
+            "cs": cs.toggles, "alloc": alloc}
+
+
+def run():
+    _install_modules()
+    import st7789
+    results = {}
+    for name, func in PRIMITIVES:
+        for buf_size in BUF_SIZES:
+            results["%s/%d" % (name, buf_size)] = measure(
+                st7789, buf_size, func)
+    return results
+
+
+def report(results, baseline=None, tolerance=0.0):
+    """Prints the results and returns the names of regressed benchmarks."""
+    regressions = []
+    print("%-20s" % "benchmark" + "".join("%10s" % m for m in METRICS))
+    for name, counts in results.items():
+        line = "%-20s" % name
+        old = baseline.get(name) if baseline else None
+        regressed = False
+        for metric in METRICS:
+            value = counts[metric]
+            mark = " "
+            if old is not None and metric in old:
+                limit = old[metric] * (1 + tolerance)
+                # allocations vary slightly between runs, allow some slack
+                if metric == "alloc":
+                    limit += 256
+                if value > limit:
+                    mark = "+"
+                    regressed = True
+                elif value < old[metric]:
+                    mark = "-"
+            line += "%9d%s" % (value, mark)
+        print(line)
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--save", metavar="FILE",
+                        help="store the results as a baseline")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="compare the results against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.0,
+                        help="relative increase accepted as no regression")
+    args = parser.parse_args()
+
+    results = run()
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    regressions = report(results, baseline, args.tolerance)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if regressions:
+        print("regressions (+): " + ", ".join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
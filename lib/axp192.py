@@ -21,7 +21,9 @@
 Driver for the AXP192 power management unit.
 """
 
-from micropython import const
+from collections import namedtuple
+
+from micropython import const, schedule
 
 _AXP192_I2C_DEFAULT_ADDR = const(0x34)
 
@@ -37,10 +39,14 @@ _AXP192_DCDC13_LDO23_CTRL_LDO3 = const(0b0000_1000)
 _AXP192_DCDC13_LDO23_CTRL_LDO2 = const(0b0000_0100)
 _AXP192_DCDC13_LDO23_CTRL_DCDC3 = const(0b0000_0010)
 _AXP192_DCDC13_LDO23_CTRL_DCDC1 = const(0b0000_0001)
+# bits 6 and 4 mirror the EXTEN and DCDC2 bits of _AXP192_EXTEN_DCDC2_CTRL
+_AXP192_DCDC13_LDO23_CTRL_ALIAS_MASK = const(0b0101_0000)
+_AXP192_DCDC13_LDO23_CTRL_ALIAS_POS = const(4)
 
 _AXP192_LDO23_OUT_VOLTAGE = const(0x28)
 _AXP192_LDO23_OUT_VOLTAGE_LDO2_3_0V = const(0b1100_0000)
 _AXP192_LDO23_OUT_VOLTAGE_LDO2_MASK = const(0b1111_0000)
+_AXP192_LDO23_OUT_VOLTAGE_LDO2_POS = const(4)
 _AXP192_LDO23_OUT_VOLTAGE_LDO3_3_0V = const(0b0000_1100)
 _AXP192_LDO23_OUT_VOLTAGE_LDO3_MASK = const(0b0000_1111)
 
@@ -131,8 +137,16 @@ _AXP192_IRQ_3_STATUS = const(0x46)
 _AXP192_IRQ_4_STATUS = const(0x47)
 _AXP192_IRQ_5_STATUS = const(0x4d)
 
+_AXP192_IRQ_STATUS_LEN = const(10)  # IRQ status 1-4, gap, IRQ status 5
+
+_AXP192_IRQ_1_VBUS_INSERT = const(0b0000_1000)
+_AXP192_IRQ_1_VBUS_REMOVE = const(0b0000_0100)
+_AXP192_IRQ_2_CHARGING_START = const(0b0000_1000)
+_AXP192_IRQ_2_CHARGING_DONE = const(0b0000_0100)
+_AXP192_IRQ_3_OVER_TEMP = const(0b1000_0000)
 _AXP192_IRQ_3_PEK_SHORT_PRESS = const(0b0000_0010)
 _AXP192_IRQ_3_PEK_LONG_PRESS = const(0b0000_0001)
+_AXP192_IRQ_4_APS_LOW_VOLTAGE = const(0b0000_0001)
 
 _AXP192_ADC_ACIN_VOLTAGE_H = const(0x56)
 _AXP192_ADC_ACIN_VOLTAGE_L = const(0x57)
@@ -159,6 +173,12 @@ _AXP192_ADC_BATT_DISCHARGE_CURRENT_L = const(0x7d)
 _AXP192_ADC_APS_VOLTAGE_H = const(0x7e)
 _AXP192_ADC_APS_VOLTAGE_L = const(0x7f)
 
+# the ADC data registers form two contiguous blocks
+_AXP192_ADC_BLOCK1 = const(0x56)
+_AXP192_ADC_BLOCK1_LEN = const(10)
+_AXP192_ADC_BLOCK2 = const(0x70)
+_AXP192_ADC_BLOCK2_LEN = const(16)
+
 _AXP192_ADC_ENABLE_1 = const(0x82)
 _AXP192_ADC_ENABLE_1_BATT_VOL = const(0b1000_0000)
 _AXP192_ADC_ENABLE_1_BATT_CUR = const(0b0100_0000)
@@ -182,6 +202,7 @@ _AXP192_ADC_TS_SAMPLE_100HZ = const(0b1000_0000)
 _AXP192_ADC_TS_SAMPLE_50HZ = const(0b0100_0000)
 _AXP192_ADC_TS_SAMPLE_25HZ = const(0b0000_0000)
 _AXP192_ADC_TS_SAMPLE_MASK = const(0b1100_0000)
+_AXP192_ADC_TS_SAMPLE_POS = const(6)
 _AXP192_ADC_TS_OUT_CUR_80uA = const(0b0011_0000)
 _AXP192_ADC_TS_OUT_CUR_60uA = const(0b0010_0000)
 _AXP192_ADC_TS_OUT_CUR_40uA = const(0b0001_0000)
@@ -208,85 +229,202 @@ _AXP192_GPIO0_LDO_VOLTAGE_3_3V = const(0b1111_0000)
 _AXP192_GPIO0_LDO_VOLTAGE_2_8V = const(0b1010_0000)
 _AXP192_GPIO0_LDO_VOLTAGE_1_8V = const(0b0000_0000)
 
-
-class M5StickCPlus:
-    @staticmethod
-    def on_init(device):
+_AXP192_COULOMB_COUNTER = const(0xb0)  # 32-bit charge and discharge count
+_AXP192_COULOMB_COUNTER_LEN = const(8)
+_AXP192_COULOMB_COUNTER_CTRL = const(0xb8)
+_AXP192_COULOMB_COUNTER_CTRL_ENABLE = const(0b1000_0000)
+_AXP192_COULOMB_COUNTER_CTRL_PAUSE = const(0b0100_0000)
+_AXP192_COULOMB_COUNTER_CTRL_CLEAR = const(0b0010_0000)
+
+# ADC channels for ADCGovernor, ADC enable 1 bits in the low byte and
+# ADC enable 2 bits in the high byte
+ADC_BATT_VOLTAGE = const(0x0080)
+ADC_BATT_CURRENT = const(0x0040)
+ADC_ACIN_VOLTAGE = const(0x0020)
+ADC_ACIN_CURRENT = const(0x0010)
+ADC_VBUS_VOLTAGE = const(0x0008)
+ADC_VBUS_CURRENT = const(0x0004)
+ADC_APS_VOLTAGE = const(0x0002)
+ADC_TS_PIN = const(0x0001)
+ADC_INTERNAL_TEMP = const(0x8000)
+ADC_BATT_POWER = const(0x00c0)  # battery voltage and current
+
+# sample rates in ascending order with their sample period in milliseconds
+_ADC_RATES = (
+    (40, _AXP192_ADC_TS_SAMPLE_25HZ),
+    (20, _AXP192_ADC_TS_SAMPLE_50HZ),
+    (10, _AXP192_ADC_TS_SAMPLE_100HZ),
+    (5, _AXP192_ADC_TS_SAMPLE_200HZ),
+)
+
+EVENT_PEK_SHORT = const(1)
+EVENT_PEK_LONG = const(2)
+EVENT_VBUS_INSERT = const(3)
+EVENT_VBUS_REMOVE = const(4)
+EVENT_CHARGING_START = const(5)
+EVENT_CHARGING_DONE = const(6)
+EVENT_BATT_LOW = const(7)
+EVENT_OVER_TEMP = const(8)
+
+EVENTS_ALL = (EVENT_PEK_SHORT, EVENT_PEK_LONG, EVENT_VBUS_INSERT,
+              EVENT_VBUS_REMOVE, EVENT_CHARGING_START, EVENT_CHARGING_DONE,
+              EVENT_BATT_LOW, EVENT_OVER_TEMP)
+
+# IRQ enable register and status bit of each event, in event code order
+_EVENT_IRQS = (
+    (_AXP192_IRQ_3_ENABLE, _AXP192_IRQ_3_PEK_SHORT_PRESS),
+    (_AXP192_IRQ_3_ENABLE, _AXP192_IRQ_3_PEK_LONG_PRESS),
+    (_AXP192_IRQ_1_ENABLE, _AXP192_IRQ_1_VBUS_INSERT),
+    (_AXP192_IRQ_1_ENABLE, _AXP192_IRQ_1_VBUS_REMOVE),
+    (_AXP192_IRQ_2_ENABLE, _AXP192_IRQ_2_CHARGING_START),
+    (_AXP192_IRQ_2_ENABLE, _AXP192_IRQ_2_CHARGING_DONE),
+    (_AXP192_IRQ_4_ENABLE, _AXP192_IRQ_4_APS_LOW_VOLTAGE),
+    (_AXP192_IRQ_3_ENABLE, _AXP192_IRQ_3_OVER_TEMP),
+)
+_IRQ_STATUS_REGS = (_AXP192_IRQ_1_STATUS, _AXP192_IRQ_2_STATUS,
+                    _AXP192_IRQ_3_STATUS, _AXP192_IRQ_4_STATUS,
+                    _AXP192_IRQ_5_STATUS)
+_IRQ_ENABLE_REGS = (_AXP192_IRQ_1_ENABLE, _AXP192_IRQ_2_ENABLE,
+                    _AXP192_IRQ_3_ENABLE, _AXP192_IRQ_4_ENABLE,
+                    _AXP192_IRQ_5_ENABLE)
+
+# Writable configuration registers which are kept in a shadow copy, so they
+# can be read and modified without an I2C round trip. Status, IRQ status,
+# ADC and coulomb counter registers change on their own and are excluded.
+_SHADOW_RANGES = (
+    (0x10, 3),  # EXTEN/DCDC2 and power output control
+    (0x23, 6),  # DCDC and LDO voltages
+    (0x30, 12),  # VBUS, power off, charging, backup battery, PEK, thresholds
+    (0x40, 4),  # IRQ enable 1-4
+    (0x4a, 1),  # IRQ enable 5
+    (0x80, 6),  # DCDC mode, ADC enable and ADC settings
+    (0x90, 4),  # GPIO0-2 functions and LDOIO0 voltage
+)
+_SHADOW_START = const(0x10)
+_SHADOW_END = const(0x94)
+
+# one byte per register address, non-zero if the register is shadowed
+_SHADOWED = bytearray(256)
+for _start, _n in _SHADOW_RANGES:
+    _SHADOWED[_start:_start + _n] = b"\x01" * _n
+del _start, _n
+
+
+Snapshot = namedtuple("Snapshot", (
+    "acin_voltage", "acin_current", "vbus_voltage", "vbus_current",
+    "internal_temp", "batt_power", "batt_voltage", "batt_charge_current",
+    "batt_discharge_current", "aps_voltage"))
+
+
+def _u12(buf, i):
+    return buf[i] << 4 | buf[i + 1] & 0x0f
+
+
+def _u13(buf, i):
+    return buf[i] << 5 | buf[i + 1] & 0x1f
+
+
+def _u24(buf, i):
+    return buf[i] << 16 | buf[i + 1] << 8 | buf[i + 2]
+
+
+def _u32(buf, i):
+    return buf[i] << 24 | _u24(buf, i + 1)
+
+
+class BoardProfile:
+    """
+    Base class for board profiles. PROFILE is a sequence of (register, mask,
+    value) tuples, applied in order with AXP192.apply_profile(), so only the
+    registers which differ from the current configuration are written.
+    """
+    PROFILE = ()
+
+    @classmethod
+    def on_init(cls, device):
+        device.apply_profile(cls.PROFILE)
+
+
+class M5StickCPlus(BoardProfile):
+    PROFILE = (
         # Set LDO2 and LDO3 to 3.0V
-        device.write(_AXP192_LDO23_OUT_VOLTAGE,
-                     _AXP192_LDO23_OUT_VOLTAGE_LDO2_3_0V |
-                     _AXP192_LDO23_OUT_VOLTAGE_LDO3_3_0V)
+        (_AXP192_LDO23_OUT_VOLTAGE, 0xff,
+         _AXP192_LDO23_OUT_VOLTAGE_LDO2_3_0V |
+         _AXP192_LDO23_OUT_VOLTAGE_LDO3_3_0V),
 
         # Enable EXTEN, Disable DCDC2
-        device.write(_AXP192_EXTEN_DCDC2_CTRL,
-                     _AXP192_EXTEN_DCDC2_CTRL_EXTEN)
+        (_AXP192_EXTEN_DCDC2_CTRL, 0xff,
+         _AXP192_EXTEN_DCDC2_CTRL_EXTEN),
 
         # Enable LDO2, LDO3, DCDC1
-        val = device.read(_AXP192_DCDC13_LDO23_CTRL)
-        device.write(_AXP192_DCDC13_LDO23_CTRL, val |
-                     _AXP192_DCDC13_LDO23_CTRL_LDO2 |
-                     _AXP192_DCDC13_LDO23_CTRL_LDO3 |
-                     _AXP192_DCDC13_LDO23_CTRL_DCDC1)
+        (_AXP192_DCDC13_LDO23_CTRL,
+         _AXP192_DCDC13_LDO23_CTRL_LDO2 |
+         _AXP192_DCDC13_LDO23_CTRL_LDO3 |
+         _AXP192_DCDC13_LDO23_CTRL_DCDC1,
+         _AXP192_DCDC13_LDO23_CTRL_LDO2 |
+         _AXP192_DCDC13_LDO23_CTRL_LDO3 |
+         _AXP192_DCDC13_LDO23_CTRL_DCDC1),
 
         # ADC Sample Rate 200Hz, TS Pin 80uA, Temp Mon, Energy Saving
-        device.write(_AXP192_ADC_TS,
-                     _AXP192_ADC_TS_SAMPLE_200HZ |
-                     _AXP192_ADC_TS_OUT_CUR_80uA |
-                     _AXP192_ADC_TS_PIN_TEMP_MON |
-                     _AXP192_ADC_TS_PIN_OUT_SAVE_ENG)
+        (_AXP192_ADC_TS, 0xff,
+         _AXP192_ADC_TS_SAMPLE_200HZ |
+         _AXP192_ADC_TS_OUT_CUR_80uA |
+         _AXP192_ADC_TS_PIN_TEMP_MON |
+         _AXP192_ADC_TS_PIN_OUT_SAVE_ENG),
 
         # ADC Enable Battery, VBus, ACIn, APS, TS
-        device.write(_AXP192_ADC_ENABLE_1,
-                     _AXP192_ADC_ENABLE_1_BATT_VOL |
-                     _AXP192_ADC_ENABLE_1_BATT_CUR |
-                     _AXP192_ADC_ENABLE_1_ACIN_VOL |
-                     _AXP192_ADC_ENABLE_1_ACIN_CUR |
-                     _AXP192_ADC_ENABLE_1_VBUS_VOL |
-                     _AXP192_ADC_ENABLE_1_VBUS_CUR |
-                     _AXP192_ADC_ENABLE_1_APS_VOL |
-                     _AXP192_ADC_ENABLE_1_TS_PIN)
+        (_AXP192_ADC_ENABLE_1, 0xff,
+         _AXP192_ADC_ENABLE_1_BATT_VOL |
+         _AXP192_ADC_ENABLE_1_BATT_CUR |
+         _AXP192_ADC_ENABLE_1_ACIN_VOL |
+         _AXP192_ADC_ENABLE_1_ACIN_CUR |
+         _AXP192_ADC_ENABLE_1_VBUS_VOL |
+         _AXP192_ADC_ENABLE_1_VBUS_CUR |
+         _AXP192_ADC_ENABLE_1_APS_VOL |
+         _AXP192_ADC_ENABLE_1_TS_PIN),
 
         # VBus limit 500mA, Vbus hold at 4.4V
-        device.write(_AXP192_VBUS_IPSOUT,
-                     _AXP192_VBUS_IPSOUT_VHOLD_LIMIT |
-                     _AXP192_VBUS_IPSOUT_VHOLD_VOLTAGE_4_4V |
-                     _AXP192_VBUS_IPSOUT_VBUS_LIMIT_CURRENT |
-                     _AXP192_VBUS_IPSOUT_VBUS_LIMIT_CURRENT_500mA)
+        (_AXP192_VBUS_IPSOUT, 0xff,
+         _AXP192_VBUS_IPSOUT_VHOLD_LIMIT |
+         _AXP192_VBUS_IPSOUT_VHOLD_VOLTAGE_4_4V |
+         _AXP192_VBUS_IPSOUT_VBUS_LIMIT_CURRENT |
+         _AXP192_VBUS_IPSOUT_VBUS_LIMIT_CURRENT_500mA),
 
         # Automatically power off at 3.0V
-        device.write(_AXP192_POWER_OFF_VOLTAGE,
-                     _AXP192_POWER_OFF_VOLTAGE_3_0V)
+        (_AXP192_POWER_OFF_VOLTAGE, 0xff,
+         _AXP192_POWER_OFF_VOLTAGE_3_0V),
 
         # Battery charging voltage 4.2V, current 100mA
-        device.write(_AXP192_CHARGING_CTRL1,
-                     _AXP192_CHARGING_CTRL1_ENABLE |
-                     _AXP192_CHARGING_CTRL1_VOLTAGE_4_20V |
-                     _AXP192_CHARGING_CTRL1_CHARGING_THRESH_10PERC |
-                     _AXP192_CHARGING_CTRL1_CURRENT_100mA)
+        (_AXP192_CHARGING_CTRL1, 0xff,
+         _AXP192_CHARGING_CTRL1_ENABLE |
+         _AXP192_CHARGING_CTRL1_VOLTAGE_4_20V |
+         _AXP192_CHARGING_CTRL1_CHARGING_THRESH_10PERC |
+         _AXP192_CHARGING_CTRL1_CURRENT_100mA),
 
         # PEK Short Press 128ms, Long Press 1.5s, Power Off 4s
-        device.write(_AXP192_PEK,
-                     _AXP192_PEK_SHORT_PRESS_128mS |
-                     _AXP192_PEK_LONG_PRESS_1_5S |
-                     _AXP192_PEK_LONG_PRESS_POWER_OFF |
-                     _AXP192_PEK_PWROK_DELAY_64mS |
-                     _AXP192_PEK_POWER_OFF_TIME_4S)
+        (_AXP192_PEK, 0xff,
+         _AXP192_PEK_SHORT_PRESS_128mS |
+         _AXP192_PEK_LONG_PRESS_1_5S |
+         _AXP192_PEK_LONG_PRESS_POWER_OFF |
+         _AXP192_PEK_PWROK_DELAY_64mS |
+         _AXP192_PEK_POWER_OFF_TIME_4S),
 
         # Ensure high temp threshold default value
-        device.write(_AXP192_BATT_TEMP_HIGH_THRESH,
-                     _AXP192_BATT_TEMP_HIGH_THRESH_DEFAULT)
+        (_AXP192_BATT_TEMP_HIGH_THRESH, 0xff,
+         _AXP192_BATT_TEMP_HIGH_THRESH_DEFAULT),
 
         # RTC Backup Battery Enable at 3.0V, charging with 200uA
-        device.write(_AXP192_BACKUP_BATT,
-                     _AXP192_BACKUP_BATT_CHARGING_ENABLE |
-                     _AXP192_BACKUP_BATT_CHARGING_VOLTAGE_3_0V |
-                     _AXP192_BACKUP_BATT_CHARGING_CURRENT_200uA)
+        (_AXP192_BACKUP_BATT, 0xff,
+         _AXP192_BACKUP_BATT_CHARGING_ENABLE |
+         _AXP192_BACKUP_BATT_CHARGING_VOLTAGE_3_0V |
+         _AXP192_BACKUP_BATT_CHARGING_CURRENT_200uA),
 
         # Set GPIO0 as LDOIO0 at 3.3V
-        device.write(_AXP192_GPIO0_LDO_VOLTAGE,
-                     _AXP192_GPIO0_LDO_VOLTAGE_3_3V)
-        device.write(_AXP192_GPIO0_FUNCTION,
-                     _AXP192_GPIO0_FUNCTION_LDO_OUTPUT)
+        (_AXP192_GPIO0_LDO_VOLTAGE, 0xff,
+         _AXP192_GPIO0_LDO_VOLTAGE_3_3V),
+        (_AXP192_GPIO0_FUNCTION, 0xff,
+         _AXP192_GPIO0_FUNCTION_LDO_OUTPUT),
+    )
 
 
 class AXP192:
@@ -294,79 +432,373 @@ class AXP192:
         self.i2c = i2c
         self.addr = addr
         self.buf = bytearray(1)
+        self.adc = bytearray(_AXP192_ADC_BLOCK1_LEN + _AXP192_ADC_BLOCK2_LEN)
+        self._adc1 = memoryview(self.adc)[:_AXP192_ADC_BLOCK1_LEN]
+        self._adc2 = memoryview(self.adc)[_AXP192_ADC_BLOCK1_LEN:]
+        self._adc2_bytes = memoryview(self.adc)[:2]
+        self._adc3_bytes = memoryview(self.adc)[:3]
+        self._cc = bytearray(_AXP192_COULOMB_COUNTER_LEN)
+        self._irq_pin = None
+        self._irq_pending = False
+        self._irq_status = bytearray(_AXP192_IRQ_STATUS_LEN)
+        self._irq_service = self._service  # avoid allocating in the ISR
+        self._queue = bytearray(0)
+        self._queue_head = 0
+        self._queue_len = 0
+        self._pek = 0
         if self.read(_AXP192_POWER_STATUS) == 0xff:
             raise ValueError("device not found")
+        self.shadow = bytearray(_SHADOW_END)
+        self.refresh()
         if board is not None:
             board.on_init(self)
 
+    def refresh(self):
+        """
+        Reloads the shadow copy of the configuration registers with a single
+        burst read. Only needed if the registers were changed by other means
+        than this driver.
+        """
+        self.i2c.readfrom_mem_into(
+            self.addr, _SHADOW_START,
+            memoryview(self.shadow)[_SHADOW_START:_SHADOW_END])
+
     def read(self, regaddr):
+        if _SHADOWED[regaddr]:
+            return self.shadow[regaddr]
         self.i2c.readfrom_mem_into(self.addr, regaddr, self.buf)
         return self.buf[0]
 
     def write(self, regaddr, val):
         self.buf[0] = val
         self.i2c.writeto_mem(self.addr, regaddr, self.buf)
+        if _SHADOWED[regaddr]:
+            self.shadow[regaddr] = val
+            self._sync_alias(regaddr, val)
+
+    def _sync_alias(self, regaddr, val):
+        # EXTEN and DCDC2 can be switched through either register, keep the
+        # shadow copy of the other one in sync
+        shadow = self.shadow
+        mask = _AXP192_DCDC13_LDO23_CTRL_ALIAS_MASK
+        pos = _AXP192_DCDC13_LDO23_CTRL_ALIAS_POS
+        if regaddr == _AXP192_EXTEN_DCDC2_CTRL:
+            shadow[_AXP192_DCDC13_LDO23_CTRL] = (
+                shadow[_AXP192_DCDC13_LDO23_CTRL] & ~mask |
+                val << pos & mask)
+        elif regaddr == _AXP192_DCDC13_LDO23_CTRL:
+            shadow[_AXP192_EXTEN_DCDC2_CTRL] = (
+                shadow[_AXP192_EXTEN_DCDC2_CTRL] & ~(mask >> pos) |
+                (val & mask) >> pos)
+
+    def update(self, regaddr, mask, val):
+        """
+        Sets the bits of a register selected by mask to val. For registers in
+        the shadow copy, this costs at most a single write, which is skipped
+        if the bits are already set as requested.
+        """
+        old = self.read(regaddr)
+        new = (old & ~mask) | (val & mask)
+        if new != old:
+            self.write(regaddr, new)
+
+    def apply_profile(self, profile, verify=False):
+        """
+        Applies a sequence of (register, mask, value) tuples in order. Since
+        the configuration registers are compared against the shadow copy,
+        only those which differ are written. If verify is set, the registers
+        are read back afterwards and OSError is raised on a mismatch.
+        """
+        for regaddr, mask, val in profile:
+            self.update(regaddr, mask, val)
+        if verify:
+            self.refresh()
+            for regaddr, mask, val in profile:
+                if (self.read(regaddr) ^ val) & mask:
+                    raise OSError(
+                        "verify failed for register 0x{:02x}".format(regaddr))
+
+    def _burst(self, regaddr, n):
+        """Reads n (2 or 3) consecutive registers into the ADC buffer."""
+        buf = self._adc3_bytes if n == 3 else self._adc2_bytes
+        self.i2c.readfrom_mem_into(self.addr, regaddr, buf)
+        return buf
 
     def batt_voltage(self):
-        val = self.read(_AXP192_ADC_BATT_VOLTAGE_H) << 4
-        val |= self.read(_AXP192_ADC_BATT_VOLTAGE_L)
+        val = _u12(self._burst(_AXP192_ADC_BATT_VOLTAGE_H, 2), 0)
         return val * 1.1 / 1000  # 1.1mV per LSB
 
     def batt_power(self):
-        val = self.read(_AXP192_ADC_BATT_POWER_H) << 16
-        val |= self.read(_AXP192_ADC_BATT_POWER_M) << 8
-        val |= self.read(_AXP192_ADC_BATT_POWER_L)
+        val = _u24(self._burst(_AXP192_ADC_BATT_POWER_H, 3), 0)
         return val * 1.1 * 0.5 / 1000  # 1.1mV * 0.5mA per LSB
 
     def batt_charge_current(self):
-        val = self.read(_AXP192_ADC_BATT_CHARGE_CURRENT_H) << 5
-        val |= self.read(_AXP192_ADC_BATT_CHARGE_CURRENT_L)
+        val = _u13(self._burst(_AXP192_ADC_BATT_CHARGE_CURRENT_H, 2), 0)
         return val * 0.5 / 1000  # 0.5mA per LSB
 
     def batt_discharge_current(self):
-        val = self.read(_AXP192_ADC_BATT_DISCHARGE_CURRENT_H) << 5
-        val |= self.read(_AXP192_ADC_BATT_DISCHARGE_CURRENT_L)
+        val = _u13(self._burst(_AXP192_ADC_BATT_DISCHARGE_CURRENT_H, 2), 0)
         return val * 0.5 / 1000  # 0.5mA per LSB
 
     def acin_voltage(self):
-        val = self.read(_AXP192_ADC_ACIN_VOLTAGE_H) << 4
-        val |= self.read(_AXP192_ADC_ACIN_VOLTAGE_L)
+        val = _u12(self._burst(_AXP192_ADC_ACIN_VOLTAGE_H, 2), 0)
         return val * 1.7 / 1000  # 1.7mV per LSB
 
     def acin_current(self):
-        val = self.read(_AXP192_ADC_ACIN_CURRENT_H) << 4
-        val |= self.read(_AXP192_ADC_ACIN_CURRENT_L)
+        val = _u12(self._burst(_AXP192_ADC_ACIN_CURRENT_H, 2), 0)
         return val * 0.625 / 1000  # 0.625mA per LSB
 
     def vbus_voltage(self):
-        val = self.read(_AXP192_ADC_VBUS_VOLTAGE_H) << 4
-        val |= self.read(_AXP192_ADC_VBUS_VOLTAGE_L)
+        val = _u12(self._burst(_AXP192_ADC_VBUS_VOLTAGE_H, 2), 0)
         return val * 1.7 / 1000  # 1.7mV per LSB
 
     def vbus_current(self):
-        val = self.read(_AXP192_ADC_VBUS_CURRENT_H) << 4
-        val |= self.read(_AXP192_ADC_VBUS_CURRENT_L)
+        val = _u12(self._burst(_AXP192_ADC_VBUS_CURRENT_H, 2), 0)
         return val * 0.375 / 1000  # 0.375mA per LSB
 
     def aps_voltage(self):
-        val = self.read(_AXP192_ADC_APS_VOLTAGE_H) << 4
-        val |= self.read(_AXP192_ADC_APS_VOLTAGE_L)
+        val = _u12(self._burst(_AXP192_ADC_APS_VOLTAGE_H, 2), 0)
         return val * 1.4 / 1000  # 1.4mV per LSB
 
     def internal_temp(self):
-        val = self.read(_AXP192_ADC_INTERNAL_TEMP_H) << 4
-        val |= self.read(_AXP192_ADC_INTERNAL_TEMP_L)
+        val = _u12(self._burst(_AXP192_ADC_INTERNAL_TEMP_H, 2), 0)
         return val * 0.1 - 144.7  # 0.1C per LSB, offset 144.7C
 
+    def snapshot(self):
+        """
+        Reads all ADC channels with two burst reads, so that the high and low
+        bytes of each value come from the same sample. Returns a Snapshot
+        with the same values as the individual getters.
+        """
+        self.i2c.readfrom_mem_into(self.addr, _AXP192_ADC_BLOCK1, self._adc1)
+        self.i2c.readfrom_mem_into(self.addr, _AXP192_ADC_BLOCK2, self._adc2)
+        b = self.adc
+        b1 = -_AXP192_ADC_BLOCK1
+        b2 = _AXP192_ADC_BLOCK1_LEN - _AXP192_ADC_BLOCK2
+        return Snapshot(
+            _u12(b, b1 + _AXP192_ADC_ACIN_VOLTAGE_H) * 1.7 / 1000,
+            _u12(b, b1 + _AXP192_ADC_ACIN_CURRENT_H) * 0.625 / 1000,
+            _u12(b, b1 + _AXP192_ADC_VBUS_VOLTAGE_H) * 1.7 / 1000,
+            _u12(b, b1 + _AXP192_ADC_VBUS_CURRENT_H) * 0.375 / 1000,
+            _u12(b, b1 + _AXP192_ADC_INTERNAL_TEMP_H) * 0.1 - 144.7,
+            _u24(b, b2 + _AXP192_ADC_BATT_POWER_H) * 1.1 * 0.5 / 1000,
+            _u12(b, b2 + _AXP192_ADC_BATT_VOLTAGE_H) * 1.1 / 1000,
+            _u13(b, b2 + _AXP192_ADC_BATT_CHARGE_CURRENT_H) * 0.5 / 1000,
+            _u13(b, b2 + _AXP192_ADC_BATT_DISCHARGE_CURRENT_H) * 0.5 / 1000,
+            _u12(b, b2 + _AXP192_ADC_APS_VOLTAGE_H) * 1.4 / 1000,
+        )
+
+    def set_coulomb_counter(self, enable):
+        """Starts (or resumes after a pause) or stops the coulomb counter."""
+        self.write(_AXP192_COULOMB_COUNTER_CTRL,
+                   _AXP192_COULOMB_COUNTER_CTRL_ENABLE if enable else 0)
+
+    def pause_coulomb_counter(self):
+        """Stops counting, but keeps the accumulated value."""
+        self.write(_AXP192_COULOMB_COUNTER_CTRL,
+                   _AXP192_COULOMB_COUNTER_CTRL_ENABLE |
+                   _AXP192_COULOMB_COUNTER_CTRL_PAUSE)
+
+    def clear_coulomb_counter(self):
+        """Resets the accumulated value to zero and keeps counting."""
+        self.write(_AXP192_COULOMB_COUNTER_CTRL,
+                   _AXP192_COULOMB_COUNTER_CTRL_ENABLE |
+                   _AXP192_COULOMB_COUNTER_CTRL_CLEAR)
+
+    def coulomb_counter(self):
+        """
+        Returns the net charge in Ah which flowed into the battery since the
+        counter was cleared, negative if the battery was discharged. Both
+        counters are read with a single burst read.
+        """
+        buf = self._cc
+        self.i2c.readfrom_mem_into(self.addr, _AXP192_COULOMB_COUNTER, buf)
+        val = _u32(buf, 0) - _u32(buf, 4)
+        # the counters accumulate the 0.5mA current samples
+        rate = 25 << (self.read(_AXP192_ADC_TS) >> _AXP192_ADC_TS_SAMPLE_POS)
+        return val * 65536 * 0.5 / 3600 / rate / 1000
+
+    def set_ldo2(self, enable):
+        """Switches LDO2, which powers the display backlight, on or off."""
+        self.update(_AXP192_DCDC13_LDO23_CTRL,
+                    _AXP192_DCDC13_LDO23_CTRL_LDO2,
+                    _AXP192_DCDC13_LDO23_CTRL_LDO2 if enable else 0)
+
+    def set_ldo2_voltage(self, voltage):
+        """
+        Sets the LDO2 output voltage (1.8V to 3.3V in steps of 100mV), which
+        controls the brightness of the display backlight.
+        """
+        if not 1.8 <= voltage <= 3.3:
+            raise ValueError("value out of range")
+        self.update(_AXP192_LDO23_OUT_VOLTAGE,
+                    _AXP192_LDO23_OUT_VOLTAGE_LDO2_MASK,
+                    (round((voltage - 1.8) * 10)
+                     << _AXP192_LDO23_OUT_VOLTAGE_LDO2_POS))
+
+    def enable_events(self, pin, events=EVENTS_ALL, size=16):
+        """
+        Enables the PMU interrupts for the given EVENT_* codes and disables
+        all others. pin is the machine.Pin connected to the IRQ output of the
+        PMU (GPIO35 on the M5StickC Plus). On an interrupt, all IRQ status
+        registers are read in one burst and the events are queued in a ring
+        buffer of size entries, dropping the oldest entries once it is full.
+        """
+        if size < 1:
+            raise ValueError("invalid argument(s) value")
+        enable = {}
+        for code in events:
+            reg, bit = _EVENT_IRQS[code - 1]
+            enable[reg] = enable.get(reg, 0) | bit
+        for reg in _IRQ_ENABLE_REGS:
+            self.update(reg, 0xff, enable.get(reg, 0))
+
+        if len(self._queue) != size:
+            self._queue = bytearray(size)
+        self._queue_head = 0
+        self._queue_len = 0
+        self._pek = 0
+        self._irq_pending = False
+        self._irq_pin = pin
+        pin.irq(trigger=pin.IRQ_FALLING, handler=self._irq)
+        # the IRQ line stays low until all pending bits are cleared
+        self._service(None)
+
+    def disable_events(self):
+        """Detaches the interrupt handler and disables all PMU interrupts."""
+        if self._irq_pin is not None:
+            self._irq_pin.irq(handler=None)
+            self._irq_pin = None
+        for reg in _IRQ_ENABLE_REGS:
+            self.update(reg, 0xff, 0)
+
+    def _irq(self, pin):
+        if not self._irq_pending:
+            self._irq_pending = True
+            try:
+                schedule(self._irq_service, None)
+            except RuntimeError:
+                # schedule queue full, event() will pick this up
+                self._irq_pending = False
+
+    def _service(self, _):
+        self._irq_pending = False
+        status = self._irq_status
+        self.i2c.readfrom_mem_into(self.addr, _AXP192_IRQ_1_STATUS, status)
+        # status bits are cleared by writing them back as ones, one register
+        # at a time since writes do not auto-increment the register address
+        for regaddr in _IRQ_STATUS_REGS:
+            val = status[regaddr - _AXP192_IRQ_1_STATUS]
+            if val:
+                self.write(regaddr, val)
+
+        self._pek |= status[2] & (_AXP192_IRQ_3_PEK_SHORT_PRESS |
+                                  _AXP192_IRQ_3_PEK_LONG_PRESS)
+        queue = self._queue
+        size = len(queue)
+        code = 0
+        for reg, bit in _EVENT_IRQS:
+            code += 1
+            if not status[reg - _AXP192_IRQ_1_ENABLE] & bit:
+                continue
+            queue[(self._queue_head + self._queue_len) % size] = code
+            if self._queue_len < size:
+                self._queue_len += 1
+            else:
+                self._queue_head = (self._queue_head + 1) % size
+
+    def event(self):
+        """
+        Returns the oldest queued EVENT_* code, or None if the queue is empty
+        or events were never enabled. No I2C transfers are made, unless the
+        IRQ line is found asserted without a pending interrupt, e.g. if an
+        edge was missed.
+        """
+        pin = self._irq_pin
+        if pin is not None and not self._irq_pending and not pin.value():
+            self._service(None)
+        if not self._queue_len:
+            return None
+        code = self._queue[self._queue_head]
+        self._queue_head = (self._queue_head + 1) % len(self._queue)
+        self._queue_len -= 1
+        return code
+
     def pek_button(self, long=False):
-        val = self.read(_AXP192_IRQ_3_STATUS)
-        val &= _AXP192_IRQ_3_PEK_SHORT_PRESS | _AXP192_IRQ_3_PEK_LONG_PRESS
-        self.write(_AXP192_IRQ_3_STATUS, val)  # clear bits
+        """
+        Returns True if the power button was pressed (for long presses only,
+        if long is set) since the last call. With events enabled, this uses
+        the interrupt status instead of polling the PMU.
+        """
+        if self._irq_pin is not None:
+            val = self._pek
+            self._pek = 0
+        else:
+            val = self.read(_AXP192_IRQ_3_STATUS)
+            val &= (_AXP192_IRQ_3_PEK_SHORT_PRESS |
+                    _AXP192_IRQ_3_PEK_LONG_PRESS)
+            if val:
+                self.write(_AXP192_IRQ_3_STATUS, val)  # clear bits
         if long:
             val &= _AXP192_IRQ_3_PEK_LONG_PRESS
         return bool(val)
 
     def power_off(self):
-        val = self.read(_AXP192_POWER_OFF_BATT_CHGLED_CTRL)
-        val |= _AXP192_POWER_OFF_BATT_CHGLED_CTRL_OFF
-        self.write(_AXP192_POWER_OFF_BATT_CHGLED_CTRL, val)
+        self.update(_AXP192_POWER_OFF_BATT_CHGLED_CTRL,
+                    _AXP192_POWER_OFF_BATT_CHGLED_CTRL_OFF,
+                    _AXP192_POWER_OFF_BATT_CHGLED_CTRL_OFF)
+
+
+class ADCGovernor:
+    def __init__(self, device, keep=ADC_TS_PIN):
+        """
+        Enables only the ADC channels of device, an AXP192 instance, which
+        have registered consumers and selects the lowest sample rate meeting
+        the freshness required by all of them. The ADC_* channels in keep
+        stay enabled regardless, by default the TS pin, which the PMU uses
+        to monitor the battery temperature while charging.
+
+        Note that the coulomb counter needs ADC_BATT_CURRENT, and changing
+        the sample rate while it runs skews the already accumulated count.
+        """
+        self.device = device
+        self.keep = keep
+        self._consumers = {}
+        self._handle = 0
+        self._apply()
+
+    def register(self, channels, max_age=1000):
+        """
+        Registers a consumer of the given ADC_* channels (or-ed together)
+        which needs values no older than max_age milliseconds. Returns a
+        handle to pass to unregister().
+        """
+        if not channels or max_age <= 0:
+            raise ValueError("invalid argument(s) value")
+        self._handle += 1
+        self._consumers[self._handle] = (channels, max_age)
+        self._apply()
+        return self._handle
+
+    def unregister(self, handle):
+        """Removes a consumer, disabling the channels no longer needed."""
+        del self._consumers[handle]
+        self._apply()
+
+    def _apply(self):
+        channels = self.keep
+        max_age = None
+        for c, age in self._consumers.values():
+            channels |= c
+            if max_age is None or age < max_age:
+                max_age = age
+        # the lowest rate meeting max_age, or the highest if none does
+        for period, rate in _ADC_RATES:
+            if max_age is None or period <= max_age:
+                break
+
+        device = self.device
+        device.update(_AXP192_ADC_ENABLE_1, 0xff, channels & 0xff)
+        device.update(_AXP192_ADC_ENABLE_2, _AXP192_ADC_ENABLE_2_TEMP_MON,
+                      channels >> 8)
+        device.update(_AXP192_ADC_TS, _AXP192_ADC_TS_SAMPLE_MASK, rate)
@@ -0,0 +1,136 @@
+# Copyright (c) 2020 Sebastian Wicki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Battery fuel gauge for the AXP192, estimating the state of charge from the
+coulomb counter and correcting its drift with the battery voltage.
+"""
+from array import array
+
+from utime import ticks_diff, ticks_ms
+
+# open circuit voltage of a single cell LiPo battery at 100%, 90%, ... 0%
+OCV_LIPO = (4.20, 4.08, 4.00, 3.93, 3.87, 3.82, 3.79, 3.77, 3.74, 3.68, 3.30)
+
+
+def ocv_to_soc(voltage, table=OCV_LIPO):
+    """
+    Returns the state of charge in percent for an open circuit voltage by
+    interpolating table, which lists the voltages from 100% to 0% in equal
+    steps.
+    """
+    if voltage >= table[0]:
+        return 100.0
+    step = 100 / (len(table) - 1)
+    for i in range(1, len(table)):
+        hi, lo = table[i - 1], table[i]
+        if voltage >= lo:
+            return 100 - step * (i - (voltage - lo) / (hi - lo))
+    return 0.0
+
+
+class FuelGauge:
+    def __init__(self, pmu, capacity, table=OCV_LIPO, resistance=0.2,
+                 gain=0.05, interval=60000, history=32):
+        """
+        Estimates the state of charge of the battery attached to pmu, an
+        axp192.AXP192 instance, with a capacity given in Ah. The estimate
+        starts from the battery voltage and then follows the coulomb counter,
+        which is enabled if necessary.
+
+        To correct the drift of the counter, each update moves the estimate
+        by gain towards the voltage based estimate. The voltage drop over the
+        internal resistance (in ohms) of the battery is compensated using the
+        measured charge and discharge currents.
+
+        Every interval milliseconds, the estimate is recorded in a ring buffer
+        of history samples, from which remaining() predicts the runtime.
+        """
+        if capacity <= 0 or history < 2:
+            raise ValueError("invalid argument(s) value")
+        self.pmu = pmu
+        self.capacity = capacity
+        self.table = table
+        self.resistance = resistance
+        self.gain = gain
+        self.interval = interval
+        # timestamps and estimates in half percent of the recorded samples
+        self._times = array("i", (0 for _ in range(history)))
+        self._socs = bytearray(history)
+        self._head = -1
+        self._count = 0
+
+        pmu.set_coulomb_counter(True)
+        self._charge = pmu.coulomb_counter()
+        self.soc = self._ocv_soc()
+        self._record(ticks_ms())
+
+    def _ocv_soc(self):
+        s = self.pmu.snapshot()
+        current = s.batt_discharge_current - s.batt_charge_current
+        return ocv_to_soc(s.batt_voltage + current * self.resistance,
+                          self.table)
+
+    def _record(self, now):
+        n = len(self._socs)
+        self._head = (self._head + 1) % n
+        self._count = min(self._count + 1, n)
+        self._times[self._head] = now
+        self._socs[self._head] = round(self.soc * 2)
+
+    def update(self):
+        """
+        Reads the coulomb counter and the battery ADC channels and updates
+        soc, the estimated state of charge in percent. Returns soc.
+        """
+        charge = self.pmu.coulomb_counter()
+        soc = self.soc + (charge - self._charge) * 100 / self.capacity
+        self._charge = charge
+        soc += (self._ocv_soc() - soc) * self.gain
+        self.soc = min(max(soc, 0.0), 100.0)
+
+        now = ticks_ms()
+        if ticks_diff(now, self._times[self._head]) >= self.interval:
+            self._record(now)
+        return self.soc
+
+    def history(self):
+        """Yields the recorded (ticks_ms, percent) samples, oldest first."""
+        n = len(self._socs)
+        for i in range(self._head - self._count + 1, self._head + 1):
+            i %= n
+            yield self._times[i], self._socs[i] / 2
+
+    def remaining(self):
+        """
+        Returns the predicted remaining runtime in milliseconds, based on the
+        average discharge rate over the recorded history. No I2C transfers
+        are made. Returns None if the battery has not been discharging or not
+        enough history is available yet.
+        """
+        if self._count < 2:
+            return None
+        new = self._head
+        old = (new - self._count + 1) % len(self._socs)
+        used = self._socs[old] - self._socs[new]
+        if used <= 0:
+            return None
+        elapsed = ticks_diff(self._times[new], self._times[old])
+        left = self._socs[new] * elapsed // used
+        return max(left - ticks_diff(ticks_ms(), self._times[new]), 0)
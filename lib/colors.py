@@ -23,6 +23,11 @@
 
 from micropython import const
 
+try:
+    import colors_viper as _viper
+except Exception:  # not on MicroPython or built without the viper emitter
+    _viper = None
+
 BLACK = const(0x0000)
 BLUE = const(0x001F)
 RED = const(0xF800)
@@ -40,3 +45,242 @@ def rgb565(r, g=0, b=0):
     except TypeError:
         pass
     return (r & 0xf8) << 8 | (g & 0xfc) << 3 | b >> 3
+
+
+def rgb444(r, g=0, b=0):
+    """Convert red, green and blue values (0-255) into a 12-bit 444 encoding."""
+    try:
+        r, g, b = r  # see if the first var is a tuple/list
+    except TypeError:
+        pass
+    return (r & 0xf0) << 4 | (g & 0xf0) | b >> 4
+
+
+def rgb565_to_rgb444(c):
+    """Convert a 16-bit 565 color into the 12-bit 444 color it is shown as."""
+    return c >> 4 & 0xf00 | c >> 3 & 0x0f0 | c >> 1 & 0x00f
+
+
+def rgb444_to_rgb565(c):
+    """
+    Convert a 12-bit 444 color into a 16-bit 565 color, e.g. for drawing in
+    12-bit color mode, where the driver still expects 565 colors.
+    """
+    r, g, b = c >> 8 & 0xf, c >> 4 & 0xf, c & 0xf
+    # replicate the upper bits, so that 0xfff becomes white
+    return (r << 1 | r >> 3) << 11 | (g << 2 | g >> 2) << 5 | b << 1 | b >> 3
+
+
+# 4x4 Bayer matrix for ordered dithering, thresholds 0 to 15
+_BAYER = b"\x00\x08\x02\x0a\x0c\x04\x0e\x06\x03\x0b\x01\x09\x0f\x07\x0d\x05"
+
+_gray_lut = None
+
+
+def _gray_table():
+    # big-endian RGB565 for each gray level, built on first use
+    global _gray_lut
+    if _gray_lut is None:
+        _gray_lut = bytearray(512)
+        for g in range(256):
+            _gray_lut[2 * g] = g & 0xf8 | g >> 5
+            _gray_lut[2 * g + 1] = (g & 0x1c) << 3 | g >> 3
+    return _gray_lut
+
+
+def rgb888_to_rgb565(src, dst=None, bgr=False, width=0):
+    """
+    Convert a buffer of RGB888 pixels (BGR888 if bgr is set) into big-endian
+    RGB565 pixels as expected by ST7789.blit_buffer(). Without dst, the
+    conversion is done in place. dst may also point into src, as long as it
+    does not start after src. If width is given, ordered dithering is
+    applied to rows of width pixels. Returns the number of bytes written.
+    """
+    if dst is None:
+        dst = src
+    n = len(src) // 3
+    if len(dst) < n * 2:
+        raise ValueError("buffer too small")
+    r, b = (2, 0) if bgr else (0, 2)
+    if _viper is not None:
+        if width:
+            _viper.rgb888_dither(src, dst, n, r, b, width, _BAYER)
+        else:
+            _viper.rgb888(src, dst, n, r, b)
+        return n * 2
+
+    s = d = x = row = 0
+    for _ in range(n):
+        red, green, blue = src[s + r], src[s + 1], src[s + b]
+        if width:
+            t = _BAYER[row | x & 3]
+            red = min(red + (t >> 1), 255)
+            green = min(green + (t >> 2), 255)
+            blue = min(blue + (t >> 1), 255)
+            x += 1
+            if x == width:
+                x = 0
+                row = (row + 4) & 0x0f
+        dst[d] = red & 0xf8 | green >> 5
+        dst[d + 1] = (green & 0x1c) << 3 | blue >> 3
+        s += 3
+        d += 2
+    return n * 2
+
+
+def gray_to_rgb565(src, dst, width=0):
+    """
+    Convert a buffer of 8-bit grayscale pixels into big-endian RGB565 pixels.
+    dst must hold twice as many bytes as src. If width is given, ordered
+    dithering is applied to rows of width pixels. Returns the number of
+    bytes written.
+    """
+    n = len(src)
+    if len(dst) < n * 2:
+        raise ValueError("buffer too small")
+    if width:
+        if _viper is not None:
+            _viper.gray_dither(src, dst, n, width, _BAYER)
+            return n * 2
+        d = x = row = 0
+        for i in range(n):
+            t = _BAYER[row | x & 3]
+            g5 = min(src[i] + (t >> 1), 255)
+            g6 = min(src[i] + (t >> 2), 255)
+            dst[d] = g5 & 0xf8 | g6 >> 5
+            dst[d + 1] = (g6 & 0x1c) << 3 | g5 >> 3
+            d += 2
+            x += 1
+            if x == width:
+                x = 0
+                row = (row + 4) & 0x0f
+        return n * 2
+
+    lut = _gray_table()
+    if _viper is not None:
+        _viper.gray(src, dst, n, lut)
+        return n * 2
+    d = 0
+    for i in range(n):
+        g = src[i] << 1
+        dst[d] = lut[g]
+        dst[d + 1] = lut[g + 1]
+        d += 2
+    return n * 2
+
+
+def swap16(buf):
+    """
+    Swap the bytes of each 16-bit value in buf in place, e.g. to convert
+    native little-endian RGB565 pixels into the big-endian byte order sent
+    to the display.
+    """
+    n = len(buf) & ~1
+    if _viper is not None:
+        _viper.swap16(buf, n)
+        return
+    for i in range(0, n, 2):
+        buf[i], buf[i + 1] = buf[i + 1], buf[i]
+
+
+# red and blue can be weighted together and green separately, with weights
+# of up to 32 the channels do not overflow into each other and all values
+# stay small ints on MicroPython
+_RB_MASK = const(0xf81f)
+_G_MASK = const(0x07e0)
+
+# blend weights (0-32) for 4-bit alpha values, 8-bit ones are built on use
+_ALPHA4 = bytes((a * 32 + 7) // 15 for a in range(16))
+_alpha8 = None
+
+
+def _alpha_table(bits):
+    global _alpha8
+    if bits == 4:
+        return _ALPHA4
+    if bits != 8:
+        raise ValueError("invalid argument(s) value")
+    if _alpha8 is None:
+        _alpha8 = bytes((a * 32 + 127) // 255 for a in range(256))
+    return _alpha8
+
+
+def _mix(fg, bg, a):
+    b = 32 - a
+    return ((fg & _RB_MASK) * a + (bg & _RB_MASK) * b >> 5 & _RB_MASK |
+            (fg & _G_MASK) * a + (bg & _G_MASK) * b >> 5 & _G_MASK)
+
+
+def blend(fg, bg, alpha):
+    """
+    Blend the 16-bit 565 colors fg and bg, with alpha ranging from 0 (only bg)
+    to 255 (only fg).
+    """
+    return _mix(fg, bg, (alpha * 32 + 127) // 255)
+
+
+def blend_buffer(dst, src, alpha):
+    """
+    Blend the big-endian RGB565 pixels in src over the ones in dst with a
+    constant alpha from 0 to 255, storing the result in dst.
+    """
+    a = (alpha * 32 + 127) // 255
+    n = min(len(dst), len(src)) & ~1
+    if _viper is not None:
+        _viper.blend_buffer(dst, src, n, a)
+        return
+    for i in range(0, n, 2):
+        c = _mix(src[i] << 8 | src[i + 1], dst[i] << 8 | dst[i + 1], a)
+        dst[i] = c >> 8
+        dst[i + 1] = c & 0xff
+
+
+def blend_mask(dst, color, mask, bits=8):
+    """
+    Blend the 16-bit 565 color over the big-endian RGB565 pixels in dst,
+    with a separate alpha value for each pixel taken from mask. mask holds
+    one byte per pixel with 8 bits, or two pixels per byte (high nibble
+    first) with 4 bits, e.g. an anti-aliased glyph.
+    """
+    table = _alpha_table(bits)
+    n = len(dst) // 2
+    if _viper is not None:
+        _viper.blend_mask(dst, color, mask, n, bits, table)
+        return
+    hi, lo = color >> 8, color & 0xff
+    for i in range(n):
+        if bits == 8:
+            a = table[mask[i]]
+        elif i & 1:
+            a = table[mask[i >> 1] & 0x0f]
+        else:
+            a = table[mask[i >> 1] >> 4]
+        if not a:
+            continue
+        d = 2 * i
+        if a == 32:
+            dst[d] = hi
+            dst[d + 1] = lo
+            continue
+        c = _mix(color, dst[d] << 8 | dst[d + 1], a)
+        dst[d] = c >> 8
+        dst[d + 1] = c & 0xff
+
+
+def gradient(buf, c0, c1):
+    """
+    Fill buf with big-endian RGB565 pixels fading from the 16-bit 565 color
+    c0 at the start to c1 at the end.
+    """
+    n = len(buf) // 2
+    r0, g0, b0 = c0 >> 11, c0 >> 5 & 0x3f, c0 & 0x1f
+    r1, g1, b1 = c1 >> 11, c1 >> 5 & 0x3f, c1 & 0x1f
+    steps = max(n - 1, 1)
+    half = steps // 2
+    for i in range(n):
+        j = steps - i
+        r = (r0 * j + r1 * i + half) // steps
+        g = (g0 * j + g1 * i + half) // steps
+        b = (b0 * j + b1 * i + half) // steps
+        buf[2 * i] = r << 3 | g >> 3
+        buf[2 * i + 1] = (g & 0x07) << 5 | b
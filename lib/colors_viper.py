@@ -0,0 +1,146 @@
+# Copyright (c) 2020 Sebastian Wicki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Native code kernels for the bulk conversions and blending in colors. This
+module is only imported by colors, which falls back to plain Python if the
+port was built without the viper code emitter.
+"""
+import micropython
+
+
+@micropython.viper
+def rgb888(src: ptr8, dst: ptr8, n: int, r: int, b: int):
+    s = 0
+    d = 0
+    for _ in range(n):
+        red = src[s + r]
+        green = src[s + 1]
+        blue = src[s + b]
+        dst[d] = (red & 0xf8) | (green >> 5)
+        dst[d + 1] = ((green & 0x1c) << 3) | (blue >> 3)
+        s += 3
+        d += 2
+
+
+@micropython.viper
+def rgb888_dither(src: ptr8, dst: ptr8, n: int, r: int, b: int, width: int,
+                  bayer: ptr8):
+    s = 0
+    d = 0
+    x = 0
+    row = 0
+    for _ in range(n):
+        t = bayer[row | (x & 3)]
+        red = src[s + r] + (t >> 1)
+        green = src[s + 1] + (t >> 2)
+        blue = src[s + b] + (t >> 1)
+        if red > 255:
+            red = 255
+        if green > 255:
+            green = 255
+        if blue > 255:
+            blue = 255
+        dst[d] = (red & 0xf8) | (green >> 5)
+        dst[d + 1] = ((green & 0x1c) << 3) | (blue >> 3)
+        s += 3
+        d += 2
+        x += 1
+        if x == width:
+            x = 0
+            row = (row + 4) & 0x0f
+
+
+@micropython.viper
+def gray(src: ptr8, dst: ptr8, n: int, lut: ptr8):
+    d = 0
+    for i in range(n):
+        g = src[i] << 1
+        dst[d] = lut[g]
+        dst[d + 1] = lut[g + 1]
+        d += 2
+
+
+@micropython.viper
+def gray_dither(src: ptr8, dst: ptr8, n: int, width: int, bayer: ptr8):
+    d = 0
+    x = 0
+    row = 0
+    for i in range(n):
+        t = bayer[row | (x & 3)]
+        g5 = src[i] + (t >> 1)
+        g6 = src[i] + (t >> 2)
+        if g5 > 255:
+            g5 = 255
+        if g6 > 255:
+            g6 = 255
+        dst[d] = (g5 & 0xf8) | (g6 >> 5)
+        dst[d + 1] = ((g6 & 0x1c) << 3) | (g5 >> 3)
+        d += 2
+        x += 1
+        if x == width:
+            x = 0
+            row = (row + 4) & 0x0f
+
+
+@micropython.viper
+def swap16(buf: ptr8, n: int):
+    for i in range(0, n, 2):
+        c = buf[i]
+        buf[i] = buf[i + 1]
+        buf[i + 1] = c
+
+
+@micropython.viper
+def blend_buffer(dst: ptr8, src: ptr8, n: int, a: int):
+    b = 32 - a
+    for i in range(0, n, 2):
+        fg = (src[i] << 8) | src[i + 1]
+        bg = (dst[i] << 8) | dst[i + 1]
+        c = ((((fg & 0xf81f) * a + (bg & 0xf81f) * b) >> 5) & 0xf81f) | (
+            (((fg & 0x07e0) * a + (bg & 0x07e0) * b) >> 5) & 0x07e0)
+        dst[i] = c >> 8
+        dst[i + 1] = c & 0xff
+
+
+@micropython.viper
+def blend_mask(dst: ptr8, color: int, mask: ptr8, n: int, bits: int,
+               table: ptr8):
+    rb = color & 0xf81f
+    g = color & 0x07e0
+    for i in range(n):
+        if bits == 8:
+            a = table[mask[i]]
+        elif i & 1:
+            a = table[mask[i >> 1] & 0x0f]
+        else:
+            a = table[mask[i >> 1] >> 4]
+        if a == 0:
+            continue
+        d = 2 * i
+        if a == 32:
+            dst[d] = color >> 8
+            dst[d + 1] = color & 0xff
+            continue
+        b = 32 - a
+        bg = (dst[d] << 8) | dst[d + 1]
+        c = (((rb * a + (bg & 0xf81f) * b) >> 5) & 0xf81f) | (
+            ((g * a + (bg & 0x07e0) * b) >> 5) & 0x07e0)
+        dst[d] = c >> 8
+        dst[d + 1] = c & 0xff
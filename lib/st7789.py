@@ -24,6 +24,20 @@
 # Notable modifications:
 #   - Added support for text()
 #   - Pre-allocated shared buffer for text() and draw_rect()
+#   - Optional off-screen framebuffer with dirty rectangle tracking
+#   - Allocation-free command path with pre-allocated scratch buffers
+#   - Skip CASET/RASET if the column or row range did not change
+#   - Added support for hardware vertical scrolling
+#   - text() with scaling, bitmap fonts, glyph cache and strings of any length
+#   - Added support for palette-indexed sprites
+#   - All drawing operations are clipped against a configurable clip rectangle
+#   - Added circles, rounded rectangles, triangles and arcs drawn as spans
+#   - Support for 12-bit colors, sending 25% fewer bytes per pixel
+#   - Added partial and idle display modes
+#   - Added rotation() with the correct offsets for each orientation
+#   - Added blit_rect() to draw parts of a larger image without copying
+#   - Fast resume of an already initialized panel, e.g. after deep sleep
+#   - Added gradient fills
 #   - Minor memory optimizations for bytecode builds by using shorter error
 #     messages, more aggressive inlining, and making most consts private
 """
@@ -31,12 +45,16 @@ Driver for the ST7789 display controller.
 """
 
 import sys
+from collections import OrderedDict
+from math import cos, radians, sin, sqrt
 
 import framebuf
-import ustruct
 from micropython import const
+from ustruct import pack, pack_into
 from utime import sleep_ms
 
+import colors
+
 # commands
 _ST77XX_NOP = const(0x00)
 _ST77XX_SWRESET = const(0x01)
@@ -58,6 +76,10 @@ _ST77XX_RAMWR = const(0x2c)
 _ST77XX_RAMRD = const(0x2e)
 
 _ST77XX_PTLAR = const(0x30)
+_ST77XX_VSCRDEF = const(0x33)
+_ST77XX_VSCSAD = const(0x37)
+_ST77XX_IDMOFF = const(0x38)
+_ST77XX_IDMON = const(0x39)
 _ST77XX_COLMOD = const(0x3a)
 _ST7789_MADCTL = const(0x36)
 
@@ -69,6 +91,16 @@ _ST7789_MADCTL_BGR = const(0x08)
 _ST7789_MADCTL_MH = const(0x04)
 _ST7789_MADCTL_RGB = const(0x00)
 
+# MADCTL values for rotations by 0, 90, 180 and 270 degrees clockwise
+_ROTATIONS = (
+    0,
+    _ST7789_MADCTL_MX | _ST7789_MADCTL_MV,
+    _ST7789_MADCTL_MX | _ST7789_MADCTL_MY,
+    _ST7789_MADCTL_MY | _ST7789_MADCTL_MV,
+)
+_ROTATION_MASK = const(_ST7789_MADCTL_MX | _ST7789_MADCTL_MY |
+                       _ST7789_MADCTL_MV)
+
 _ST7789_RDID1 = const(0xda)
 _ST7789_RDID2 = const(0xdb)
 _ST7789_RDID3 = const(0xdc)
@@ -83,16 +115,79 @@ ColorMode_16M = const(0x07)
 
 _BUF_DEFAULT_LEN = const(512)
 
+# time to wait after leaving sleep mode before sending the next command
+_ST7789_SLPOUT_MS = const(5)
+
+# size of the frame memory of the controller
+_ST7789_FRAME_COLS = const(240)
+_ST7789_FRAME_ROWS = const(320)
+
 _PIXEL_LEN = const(2)
 
 _FONT_HEIGHT = const(8)
 _FONT_WIDTH = const(8)
 
+# enough for the digits and a separator at scale 2 (512 bytes per glyph)
+_GLYPH_CACHE_DEFAULT = const(6144)
+
+# maximum number of dirty rectangles tracked in framebuffer mode
+_DIRTY_MAX = const(8)
+# number of unchanged pixels we accept to resend in exchange for saving the
+# window setup of an additional dirty rectangle
+_DIRTY_SLACK = const(32)
+
+
+class GlyphCache:
+    def __init__(self, budget=_GLYPH_CACHE_DEFAULT):
+        """
+        Least-recently-used cache of rendered glyphs, holding at most budget
+        bytes of pixel data.
+        """
+        self.budget = budget
+        self.size = 0
+        self.glyphs = OrderedDict()
+
+    def get(self, key):
+        glyph = self.glyphs.pop(key, None)
+        if glyph is not None:
+            # re-insert to mark as most recently used
+            self.glyphs[key] = glyph
+        return glyph
+
+    def alloc(self, n):
+        """
+        Makes room for a glyph of n bytes by evicting the least recently used
+        glyphs. Returns an evicted buffer of the right size for reuse if there
+        is one, a new buffer otherwise.
+        """
+        glyph = None
+        if n <= self.budget:
+            while self.size + n > self.budget:
+                old = self.glyphs.pop(next(iter(self.glyphs)))
+                self.size -= len(old)
+                if len(old) == n:
+                    glyph = old
+        return glyph if glyph is not None else bytearray(n)
+
+    def put(self, key, glyph):
+        n = len(glyph)
+        if n > self.budget:
+            return
+        while self.size + n > self.budget:
+            self.size -= len(self.glyphs.pop(next(iter(self.glyphs))))
+        self.glyphs[key] = glyph
+        self.size += n
+
+    def clear(self):
+        self.glyphs = OrderedDict()
+        self.size = 0
+
 
 class ST7789:
     def __init__(self, spi, width, height, reset, dc, cs=None, buf=None,
                  xstart=-1, ystart=-1, init=True,
-                 color_mode=ColorMode_65K | ColorMode_16bit):
+                 color_mode=ColorMode_65K | ColorMode_16bit,
+                 glyph_cache=_GLYPH_CACHE_DEFAULT, rotation=0, resume=False):
         """
         display = st7789.ST7789(
             SPI(1, baudrate=40000000, phase=0, polarity=1),
@@ -101,6 +196,15 @@ class ST7789:
             dc=machine.Pin(2, machine.Pin.OUT),
             buf=bytearray(128),
         )
+
+        width, height, xstart and ystart describe the panel in its native
+        portrait orientation, see rotation() for the other orientations.
+
+        With resume=True, the panel is expected to have been initialized
+        before and to have stayed powered, e.g. during deep sleep with the
+        reset pin held high. The resets and the clearing of the screen are
+        skipped, keeping the previous screen content, and only the sleep
+        mode, color mode and rotation are restored.
         """
         self.width = width
         self.height = height
@@ -112,6 +216,22 @@ class ST7789:
         if buf is None:
             buf = bytearray(_BUF_DEFAULT_LEN)
         self.buf = memoryview(buf)
+        self._buf_fb = framebuf.FrameBuffer(
+            self.buf, len(buf) // _PIXEL_LEN, 1, framebuf.RGB565)
+        # scratch buffers for commands and their parameters
+        self._cmd = bytearray(1)
+        self._param = bytearray(4)
+        self._param2 = memoryview(self._param)[:2]
+        self._param3 = memoryview(self._param)[:3]
+
+        # pixel data is always passed in as RGB565, in 12-bit mode it is
+        # converted to RGB444 while being sent
+        depth = color_mode & 0x07
+        if depth not in (ColorMode_12bit, ColorMode_16bit):
+            raise ValueError("invalid argument(s) value")
+        self._rgb444 = depth == ColorMode_12bit
+        self._data565 = self._data444 if self._rgb444 else self._data
+        self._pend = -1
 
         if sys.byteorder == 'little':
             self._to_be16 = lambda c: (c << 8) & 0xff00 | (c >> 8) & 0x00ff
@@ -119,25 +239,43 @@ class ST7789:
             self._to_be16 = lambda c: c
 
         if xstart >= 0 and ystart >= 0:
-            self.xstart = xstart
-            self.ystart = ystart
+            pass
         elif (self.width, self.height) == (240, 240):
-            self.xstart = 0
-            self.ystart = 0
+            xstart = 0
+            ystart = 0
         elif (self.width, self.height) == (135, 240):
-            self.xstart = 52
-            self.ystart = 40
+            xstart = 52
+            ystart = 40
         else:
             # Unsupported display. Only 240x240 and 135x240 are supported
             # without xstart and ystart provided
             raise ValueError("invalid argument(s) value")
-        if init:
+        self._panel = (width, height, xstart, ystart)
+
+        self._fb = None
+        self._win = False
+        self._dirty = []
+        self._buf_len = 0
+        self.glyphs = GlyphCache(glyph_cache)
+        self._grad = None
+        self._grad_view = None
+        self._grad_key = None
+        self._madctl = _ROTATIONS[rotation & 3]
+        self._set_geometry()
+
+        if init and resume:
+            self.sleep_mode(False)
+            sleep_ms(_ST7789_SLPOUT_MS)
+            self._set_color_mode(color_mode)
+            self.rotation(rotation)
+            self.write(_ST77XX_DISPON)
+        elif init:
             self.hard_reset()
             self.soft_reset()
             self.sleep_mode(False)
             sleep_ms(10)
             self._set_color_mode(color_mode)
-            self._set_mem_access_mode(4, True, True, False)
+            self.rotation(rotation)
             self.inversion_mode(True)
             sleep_ms(10)
             self.write(_ST77XX_NORON)
@@ -156,16 +294,87 @@ class ST7789:
 
     def write(self, command=None, data=None):
         """SPI write to the device: commands and data"""
+        if command is None and self._win:
+            self._fb_write(data)
+            if self._wram:
+                return
         self.cs_low()
         if command is not None:
             self.dc.off()
-            self.spi.write(bytes([command]))
+            self._cmd[0] = command
+            self.spi.write(self._cmd)
         if data is not None:
             self.dc.on()
             self.spi.write(data)
         self.cs_high()
 
+    def _data(self, data):
+        """
+        Writes pixel data following a call to set_window(). Unlike write(),
+        this does not toggle CS, callers must call cs_high() when done.
+        """
+        if self._win:
+            self._fb_write(data)
+            if self._wram:
+                return
+        self.spi.write(data)
+
+    def _data444(self, data):
+        """
+        Converts RGB565 pixel data to RGB444 and writes it following a call to
+        set_window(). Pairs of pixels are packed into three bytes in the shared
+        buffer, so data may point into it. A trailing odd pixel is held back
+        until the next call, callers must call _end() when done.
+        """
+        spi = self.spi
+        buf = self.buf
+        end = len(buf) - 3
+        pend = self._pend
+        i = 0
+        if pend >= 0 and data:
+            # sent on its own, as its output would overtake the input
+            h, l = data[0], data[1]
+            c = ((h & 0xf0) << 4 | (h & 0x07) << 5 |
+                 (l & 0x80) >> 3 | (l & 0x1e) >> 1)
+            p = self._param
+            p[0] = pend >> 4
+            p[1] = (pend & 0x0f) << 4 | c >> 8
+            p[2] = c & 0xff
+            spi.write(self._param3)
+            pend = -1
+            i = 2
+        o = 0
+        for i in range(i, len(data), _PIXEL_LEN):
+            h, l = data[i], data[i + 1]
+            c = ((h & 0xf0) << 4 | (h & 0x07) << 5 |
+                 (l & 0x80) >> 3 | (l & 0x1e) >> 1)
+            if pend < 0:
+                pend = c
+                continue
+            buf[o] = pend >> 4
+            buf[o + 1] = (pend & 0x0f) << 4 | c >> 8
+            buf[o + 2] = c & 0xff
+            o += 3
+            pend = -1
+            if o > end:
+                spi.write(buf[:o])
+                o = 0
+        if o:
+            spi.write(buf[:o])
+        self._pend = pend
+
+    def _end(self):
+        """Sends a pixel held back by _data444() and ends the transaction."""
+        pend = self._pend
+        if pend >= 0:
+            self._param[0] = pend >> 4
+            self._param[1] = (pend & 0x0f) << 4
+            self.spi.write(self._param2)
+            self._pend = -1
+        self.cs_high()
+
     def hard_reset(self):
+        self._invalidate_window()
         self.cs_low()
         if self.reset is not None:
             self.reset.on()
@@ -177,10 +386,12 @@ class ST7789:
         self.cs_high()
 
     def soft_reset(self):
+        self._invalidate_window()
         self.write(_ST77XX_SWRESET)
         sleep_ms(120)
 
     def sleep_mode(self, value):
+        self._invalidate_window()
         if value:
             self.write(_ST77XX_SLPIN)
         else:
@@ -192,6 +403,82 @@ class ST7789:
         else:
             self.write(_ST77XX_INVOFF)
 
+    def partial_mode(self, y, height):
+        """
+        Enters the partial display mode, in which the panel only refreshes
+        the band of height rows starting at row y. The rows outside of the
+        band are not driven. Use normal_mode() to return to the full screen.
+        Not available in the landscape rotations 1 and 3.
+        """
+        if y < 0 or height <= 0 or y + height > self.height:
+            raise ValueError("invalid argument(s) value")
+        start = self._native_rows(y, height)
+        pack_into(">HH", self._param, 0, start, start + height - 1)
+        self.write(_ST77XX_PTLAR, self._param)
+        self.write(_ST77XX_PTLON)
+
+    def normal_mode(self):
+        """Leaves the partial display mode."""
+        self.write(_ST77XX_NORON)
+
+    def idle_mode(self, value):
+        """
+        In idle mode, the panel only shows 8 colors by using the most
+        significant bit of each color component, which reduces its power
+        consumption.
+        """
+        if value:
+            self.write(_ST77XX_IDMON)
+        else:
+            self.write(_ST77XX_IDMOFF)
+
+    def scroll_area(self, top=0, bottom=0):
+        """
+        Defines the area used for hardware vertical scrolling. top and bottom
+        are the number of rows at the top and at the bottom of the screen
+        which remain fixed. Resets the scroll offset to zero.
+
+        The panel can only scroll along its native vertical axis, so hardware
+        scrolling is not available in the landscape rotations 1 and 3.
+        """
+        height = self.height - top - bottom
+        if top < 0 or bottom < 0 or height <= 0:
+            raise ValueError("invalid argument(s) value")
+        tfa = self._native_rows(top, height)
+        bfa = _ST7789_FRAME_ROWS - tfa - height
+        self._scroll_top = top
+        self._scroll_height = height
+        self._scroll_tfa = tfa
+        self.write(_ST77XX_VSCRDEF, pack(">HHH", tfa, height, bfa))
+        self.scroll(0)
+
+    def scroll(self, offset):
+        """
+        Scrolls the contents of the scroll area up by offset rows, with the
+        rows scrolled out at the top reappearing at the bottom. The offset is
+        absolute, i.e. scroll(0) restores the unscrolled view.
+        """
+        if self._madctl & _ST7789_MADCTL_MV:
+            raise ValueError("invalid argument(s) value")
+        height = self._scroll_height
+        offset %= height
+        self._scroll_offset = offset
+        if self._madctl & _ST7789_MADCTL_MY:
+            # the rows are mirrored, so the panel has to scroll down
+            offset = (height - offset) % height
+        pack_into(">H", self._param2, 0, self._scroll_tfa + offset)
+        self.write(_ST77XX_VSCSAD, self._param2)
+
+    def scroll_row(self, y):
+        """
+        Returns the y coordinate which has to be used for drawing so that the
+        pixels appear on screen row y with the current scroll offset applied.
+        """
+        top = self._scroll_top
+        if top <= y < top + self._scroll_height:
+            y = top + (y - top + self._scroll_offset) % self._scroll_height
+        return y
+
     def _set_color_mode(self, mode):
         self.write(_ST77XX_COLMOD, bytes([mode & 0x77]))
 
@@ -209,40 +496,297 @@ class ST7789:
         }[rotation]
 
         if vert_mirror:
-            value = _ST7789_MADCTL_ML
-        elif horz_mirror:
-            value = _ST7789_MADCTL_MH
+            value |= _ST7789_MADCTL_ML
+        if horz_mirror:
+            value |= _ST7789_MADCTL_MH
 
         if is_bgr:
             value |= _ST7789_MADCTL_BGR
+        self._madctl = value
+        self._set_geometry()
         self.write(_ST7789_MADCTL, bytes([value]))
 
-    def _encode_pos(self, x, y):
-        """Encode a postion into bytes."""
-        return ustruct.pack(">HH", x, y)
+    def rotation(self, rotation):
+        """
+        Rotates the display content clockwise by rotation * 90 degrees. The
+        rotation is performed by the controller, width and height are swapped
+        for the landscape rotations 1 and 3. Resets the clip rectangle and
+        the scroll area and disables the framebuffer mode.
+        """
+        self._madctl &= ~_ROTATION_MASK
+        self._madctl |= _ROTATIONS[rotation & 3]
+        self._set_geometry()
+        self.write(_ST7789_MADCTL, bytes([self._madctl]))
+        # the panel keeps its scroll settings, so reset them as well
+        if self._madctl & _ST7789_MADCTL_MV:
+            self.write(_ST77XX_VSCRDEF, pack(">HHH", 0, _ST7789_FRAME_ROWS, 0))
+            self.write(_ST77XX_VSCSAD, pack(">H", 0))
+        else:
+            self.scroll_area()
+
+    def _set_geometry(self):
+        """Derives size and offsets of the display from the MADCTL value."""
+        width, height, xstart, ystart = self._panel
+        madctl = self._madctl
+        # mirroring moves the panel to the opposite end of the frame memory
+        if madctl & _ST7789_MADCTL_MX:
+            xstart = _ST7789_FRAME_COLS - width - xstart
+        if madctl & _ST7789_MADCTL_MY:
+            ystart = _ST7789_FRAME_ROWS - height - ystart
+        if madctl & _ST7789_MADCTL_MV:
+            width, height = height, width
+            xstart, ystart = ystart, xstart
+        self.width = width
+        self.height = height
+        self.xstart = xstart
+        self.ystart = ystart
+
+        self._invalidate_window()
+        self.set_framebuffer(None)
+        self._scroll_top = 0
+        self._scroll_height = height
+        self._scroll_offset = 0
+        # the first row of the panel in scan direction, for any rotation
+        self._scroll_tfa = self._panel[3]
+        self.set_clip()
+
+    def _native_rows(self, y, height):
+        """
+        Returns the first frame memory row of the band of height screen rows
+        starting at y, which is the scan direction of the panel.
+        """
+        madctl = self._madctl
+        if madctl & _ST7789_MADCTL_MV:
+            raise ValueError("invalid argument(s) value")
+        if madctl & _ST7789_MADCTL_MY:
+            return _ST7789_FRAME_ROWS - self.ystart - y - height
+        return self.ystart + y
+
+    def _command(self, command):
+        """Sends a command byte. Expects CS to be low."""
+        self.dc.off()
+        self._cmd[0] = command
+        self.spi.write(self._cmd)
+
+    def _command_pos(self, command, start, end):
+        """Sends a command with two 16-bit parameters. Expects CS to be low."""
+        self._command(command)
+        pack_into(">HH", self._param, 0, start, end)
+        self.dc.on()
+        self.spi.write(self._param)
 
-    def _encode_pixel(self, color):
-        """Encode a pixel color into bytes."""
-        return ustruct.pack(">H", color)
+    def _invalidate_window(self):
+        """Forgets the window last sent, so it is sent again on next use."""
+        self._col_start = self._col_end = -1
+        self._row_start = self._row_end = -1
 
     def _set_columns(self, start, end):
-        if start > end or end >= self.width:
-            return
+        if start > end or start < 0 or end >= self.width:
+            raise ValueError("invalid argument(s) value")
         start += self.xstart
         end += self.xstart
-        self.write(_ST77XX_CASET, self._encode_pos(start, end))
+        if start == self._col_start and end == self._col_end:
+            return
+        self._col_start = start
+        self._col_end = end
+        self._command_pos(_ST77XX_CASET, start, end)
 
     def _set_rows(self, start, end):
-        if start > end or end >= self.height:
-            return
+        if start > end or start < 0 or end >= self.height:
+            raise ValueError("invalid argument(s) value")
         start += self.ystart
         end += self.ystart
-        self.write(_ST77XX_RASET, self._encode_pos(start, end))
+        if start == self._row_start and end == self._row_end:
+            return
+        self._row_start = start
+        self._row_end = end
+        self._command_pos(_ST77XX_RASET, start, end)
 
-    def set_window(self, x0, y0, x1, y1):
+    def _set_window(self, x0, y0, x1, y1):
+        """
+        Sets the window and starts a memory write. CS is left low and DC high,
+        so the pixel data can be sent right after in the same transaction.
+        """
+        self.cs_low()
         self._set_columns(x0, x1)
         self._set_rows(y0, y1)
-        self.write(_ST77XX_RAMWR)
+        self._command(_ST77XX_RAMWR)
+        self.dc.on()
+
+    def set_window(self, x0, y0, x1, y1):
+        if self._fb is not None:
+            fbx, fby = self._fbx, self._fby
+            fbx1, fby1 = fbx + self._fbw - 1, fby + self._fbh - 1
+            if x0 > fbx1 or x1 < fbx or y0 > fby1 or y1 < fby:
+                self._win = False
+            else:
+                self._win = True
+                self._wx = x0
+                self._wy = y0
+                self._ww = x1 - x0 + 1
+                self._wh = y1 - y0 + 1
+                self._wpos = 0
+                self._wram = (x0 >= fbx and y0 >= fby and
+                              x1 <= fbx1 and y1 <= fby1)
+                if self._wram:
+                    return
+        self._set_window(x0, y0, x1, y1)
+
+    def set_clip(self, x=0, y=0, width=None, height=None):
+        """
+        Restricts all drawing operations to the given rectangle. Without
+        arguments, the clip rectangle is reset to the whole screen.
+        """
+        if width is None:
+            width = self.width - x
+        if height is None:
+            height = self.height - y
+        self._clip_x0 = max(x, 0)
+        self._clip_y0 = max(y, 0)
+        self._clip_x1 = min(x + width, self.width)
+        self._clip_y1 = min(y + height, self.height)
+
+    def set_framebuffer(self, buf, x=0, y=0, width=None, height=None):
+        """
+        Enables the off-screen framebuffer mode. All drawing operations
+        which fall within the rectangle described by x, y, width and height
+        (the whole screen by default) are performed on buf instead of the
+        display. The changed regions are sent to the display by show().
+
+        buf must hold width * height RGB565 pixels, so the framebuffer mode is
+        not available in 12-bit color mode. Passing a buf smaller than
+        the screen allows the framebuffer to cover a single tile of the screen,
+        drawing outside of the tile is sent to the display immediately.
+        Calling set_framebuffer(None) disables the framebuffer mode.
+        """
+        self._fb = None
+        self._win = False
+        self._dirty = []
+        if buf is None:
+            return
+
+        if width is None:
+            width = self.width - x
+        if height is None:
+            height = self.height - y
+        if (x < 0 or y < 0 or width <= 0 or height <= 0 or
+                x + width > self.width or y + height > self.height):
+            raise ValueError("invalid argument(s) value")
+        if self._rgb444:
+            # the framebuffer is sent as is, so it only works with RGB565
+            raise ValueError("invalid argument(s) value")
+        if len(buf) < width * height * _PIXEL_LEN:
+            raise ValueError("buffer too small")
+
+        self._fb = memoryview(buf)
+        self._fbx = x
+        self._fby = y
+        self._fbw = width
+        self._fbh = height
+        # the display content is unknown, so the first show() sends everything
+        self._dirty.append((x, y, x + width - 1, y + height - 1))
+
+    def _fb_write(self, data):
+        """
+        Copies pixel data written to the current window into the framebuffer.
+        Only pixels which actually changed are marked as dirty.
+        """
+        data = memoryview(data)
+        fb = self._fb
+        fbx, fby, fbw, fbh = self._fbx, self._fby, self._fbw, self._fbh
+        wx, wy, ww, wh = self._wx, self._wy, self._ww, self._wh
+        total = ww * wh
+        pos = self._wpos
+        n = len(data) // _PIXEL_LEN
+        i = 0
+        dx0 = dy0 = 0xffff
+        dx1 = dy1 = -1
+        while i < n:
+            row, col = divmod(pos, ww)
+            run = min(ww - col, n - i)
+            y = wy + row
+            if fby <= y < fby + fbh:
+                x = wx + col
+                a = max(x, fbx)
+                b = min(x + run, fbx + fbw)
+                if a < b:
+                    src = data[(i + a - x) * _PIXEL_LEN:(i + b - x) * _PIXEL_LEN]
+                    off = ((y - fby) * fbw + a - fbx) * _PIXEL_LEN
+                    dst = fb[off:off + (b - a) * _PIXEL_LEN]
+                    if dst != src:
+                        dst[:] = src
+                        dx0 = min(dx0, a)
+                        dx1 = max(dx1, b - 1)
+                        dy0 = min(dy0, y)
+                        dy1 = max(dy1, y)
+            i += run
+            pos += run
+            if pos >= total:
+                pos = 0
+        self._wpos = pos
+        # data written directly to the display does not need to be resent
+        if self._wram and dx1 >= 0:
+            self._damage(dx0, dy0, dx1, dy1)
+
+    def _damage(self, x0, y0, x1, y1):
+        """Adds a rectangle to the dirty list, merging it where worthwhile."""
+        dirty = self._dirty
+        i = 0
+        while i < len(dirty):
+            rx0, ry0, rx1, ry1 = dirty[i]
+            ux0, uy0 = min(x0, rx0), min(y0, ry0)
+            ux1, uy1 = max(x1, rx1), max(y1, ry1)
+            ox = min(x1, rx1) - max(x0, rx0) + 1
+            oy = min(y1, ry1) - max(y0, ry0) + 1
+            overlap = ox * oy if ox > 0 and oy > 0 else 0
+            waste = ((ux1 - ux0 + 1) * (uy1 - uy0 + 1)
+                     - (x1 - x0 + 1) * (y1 - y0 + 1)
+                     - (rx1 - rx0 + 1) * (ry1 - ry0 + 1) + overlap)
+            if waste <= _DIRTY_SLACK:
+                x0, y0, x1, y1 = ux0, uy0, ux1, uy1
+                dirty.pop(i)
+                i = 0
+            else:
+                i += 1
+
+        if len(dirty) >= _DIRTY_MAX:
+            # merge with the rectangle resulting in the smallest union
+            best = 0
+            best_area = -1
+            for i in range(len(dirty)):
+                rx0, ry0, rx1, ry1 = dirty[i]
+                area = ((max(x1, rx1) - min(x0, rx0) + 1) *
+                        (max(y1, ry1) - min(y0, ry0) + 1))
+                if best_area < 0 or area < best_area:
+                    best, best_area = i, area
+            rx0, ry0, rx1, ry1 = dirty.pop(best)
+            x0, y0 = min(x0, rx0), min(y0, ry0)
+            x1, y1 = max(x1, rx1), max(y1, ry1)
+        dirty.append((x0, y0, x1, y1))
+
+    def show(self):
+        """
+        Sends the regions of the framebuffer which changed since the last call
+        to show() to the display. Does nothing if framebuffer mode is disabled.
+        """
+        fb = self._fb
+        if fb is None:
+            return
+        self._win = False
+        stride = self._fbw * _PIXEL_LEN
+        for x0, y0, x1, y1 in self._dirty:
+            self._set_window(x0, y0, x1, y1)
+            row_len = (x1 - x0 + 1) * _PIXEL_LEN
+            rows = y1 - y0 + 1
+            off = (y0 - self._fby) * stride + (x0 - self._fbx) * _PIXEL_LEN
+            if row_len == stride:
+                self.spi.write(fb[off:off + rows * stride])
+            else:
+                for _ in range(rows):
+                    self.spi.write(fb[off:off + row_len])
+                    off += stride
+            self.cs_high()
+        self._dirty = []
 
     def vline(self, x, y, length, color):
         self.fill_rect(x, y, 1, length, color)
@@ -251,12 +795,142 @@ class ST7789:
         self.fill_rect(x, y, length, 1, color)
 
     def pixel(self, x, y, color):
+        if not (self._clip_x0 <= x < self._clip_x1 and
+                self._clip_y0 <= y < self._clip_y1):
+            return
         self.set_window(x, y, x, y)
-        self.write(None, self._encode_pixel(color))
+        if self._rgb444:
+            self._param[0] = color >> 8 & 0xf0 | color >> 7 & 0x0f
+            self._param[1] = color << 3 & 0xf0
+        else:
+            pack_into(">H", self._param2, 0, color)
+        self._data(self._param2)
+        self.cs_high()
 
     def blit_buffer(self, buffer, x, y, width, height):
-        self.set_window(x, y, x + width - 1, y + height - 1)
-        self.write(None, buffer)
+        self.blit_rect(buffer, width, 0, 0, width, height, x, y)
+
+    def blit_rect(self, buffer, stride, sx, sy, width, height, x, y):
+        """
+        Draws the width x height rectangle at sx, sy of a larger RGB565 image
+        at x, y. The image is stored in buffer with stride pixels per row.
+        The rows are sent straight from buffer without copying, rows which
+        are contiguous in buffer are sent with a single write.
+        """
+        if (sx < 0 or sy < 0 or sx + width > stride or
+                len(buffer) < ((sy + height - 1) * stride + sx + width) *
+                _PIXEL_LEN):
+            raise ValueError("invalid argument(s) value")
+        x0, y0 = max(x, self._clip_x0), max(y, self._clip_y0)
+        x1 = min(x + width, self._clip_x1)
+        y1 = min(y + height, self._clip_y1)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        self.set_window(x0, y0, x1 - 1, y1 - 1)
+        row_len = (x1 - x0) * _PIXEL_LEN
+        stride *= _PIXEL_LEN
+        offset = (sy + y0 - y) * stride + (sx + x0 - x) * _PIXEL_LEN
+        size = (y1 - y0) * stride
+        if row_len == stride:
+            if offset == 0 and size == len(buffer):
+                self._data565(buffer)
+            else:
+                # visible rows are contiguous
+                self._data565(memoryview(buffer)[offset:offset + size])
+        else:
+            buffer = memoryview(buffer)
+            for _ in range(y1 - y0):
+                self._data565(buffer[offset:offset + row_len])
+                offset += stride
+        self._end()
+
+    def _sprite_run(self, bitmap, bit, bpp, pal, x, y, width):
+        """Expands and sends a single row of width sprite pixels."""
+        buf = self.buf
+        buf_len = len(buf) // _PIXEL_LEN * _PIXEL_LEN
+        full = memoryview(buf)[:buf_len]
+        mask = (1 << bpp) - 1
+        n = 0
+        self.set_window(x, y, x + width - 1, y)
+        for _ in range(width):
+            c = (bitmap[bit >> 3] >> (8 - bpp - (bit & 7)) & mask) << 1
+            buf[n] = pal[c]
+            buf[n + 1] = pal[c + 1]
+            n += 2
+            if n == buf_len:
+                self._data565(full)
+                n = 0
+            bit += bpp
+        if n:
+            self._data565(buf[:n])
+        self._end()
+
+    def sprite(self, bitmap, x, y, width, height, bpp, palette, key=-1):
+        """
+        Draws a palette-indexed bitmap with 1, 2, 4 or 8 bits per pixel. The
+        pixels are packed MSB-first with each row starting on a new byte.
+        palette is a sequence of RGB565 colors. If key is a palette index,
+        pixels with that index are transparent. Parts of the sprite outside
+        of the clip rectangle are not drawn.
+        """
+        if bpp not in (1, 2, 4, 8):
+            raise ValueError("invalid argument(s) value")
+        x0, y0 = max(x, self._clip_x0), max(y, self._clip_y0)
+        x1 = min(x + width, self._clip_x1)
+        y1 = min(y + height, self._clip_y1)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        pal = bytearray(len(palette) * _PIXEL_LEN)
+        for i in range(len(palette)):
+            pack_into(">H", pal, i * _PIXEL_LEN, palette[i])
+        row_bits = (width * bpp + 7) // 8 * 8
+        skip = (x0 - x) * bpp
+
+        if key < 0:
+            buf = self.buf
+            buf_len = len(buf) // _PIXEL_LEN * _PIXEL_LEN
+            # an odd-sized buffer must not be sent with its last byte
+            full = memoryview(buf)[:buf_len]
+            mask = (1 << bpp) - 1
+            n = 0
+            self.set_window(x0, y0, x1 - 1, y1 - 1)
+            for row in range(y0 - y, y1 - y):
+                bit = row * row_bits + skip
+                for _ in range(x1 - x0):
+                    c = (bitmap[bit >> 3] >> (8 - bpp - (bit & 7)) & mask) << 1
+                    buf[n] = pal[c]
+                    buf[n + 1] = pal[c + 1]
+                    n += 2
+                    if n == buf_len:
+                        self._data565(full)
+                        n = 0
+                    bit += bpp
+            if n:
+                self._data565(buf[:n])
+            self._end()
+            return
+
+        # with transparency, each opaque run of pixels gets its own window
+        mask = (1 << bpp) - 1
+        for row in range(y0 - y, y1 - y):
+            bit = row * row_bits + skip
+            start = -1
+            for col in range(x0, x1):
+                c = bitmap[bit >> 3] >> (8 - bpp - (bit & 7)) & mask
+                if c == key:
+                    if start >= 0:
+                        self._sprite_run(bitmap, start_bit, bpp, pal,
+                                         start, y + row, col - start)
+                        start = -1
+                elif start < 0:
+                    start = col
+                    start_bit = bit
+                bit += bpp
+            if start >= 0:
+                self._sprite_run(bitmap, start_bit, bpp, pal,
+                                 start, y + row, x1 - start)
 
     def rect(self, x, y, w, h, color):
         self.hline(x, y, w, color)
@@ -264,28 +938,137 @@ class ST7789:
         self.vline(x + w - 1, y, h, color)
         self.hline(x, y + h - 1, w, color)
 
-    def fill_rect(self, x, y, width, height, color):
-        buf_len = len(self.buf)
-        chunks, rest = divmod(width * height * _PIXEL_LEN, buf_len)
-        f = framebuf.FrameBuffer(
-            self.buf, buf_len // _PIXEL_LEN, 1, framebuf.RGB565)
-        f.fill(self._to_be16(color))
+    def _fill_buf(self, color, pixels):
+        """
+        Fills the start of the shared buffer with up to the given number of
+        pixels of the given color, so it can be sent repeatedly by _span().
+        """
+        buf = self.buf
+        if self._rgb444:
+            # pixel pairs are packed into three bytes, the pattern is doubled
+            # in place until it covers the requested number of pixels
+            n = min(pixels + (pixels & 1), len(buf) // 3 * 2) * 3 // 2
+            c = color >> 4 & 0xf00 | color >> 3 & 0x0f0 | color >> 1 & 0x00f
+            buf[0] = c >> 4
+            buf[1] = (c & 0x0f) << 4 | c >> 8
+            buf[2] = c & 0xff
+            i = 3
+            while i < n:
+                m = min(i, n - i)
+                buf[i:i + m] = buf[:m]
+                i += m
+            self._buf_len = n
+            return
+        n = min(pixels, len(buf) // _PIXEL_LEN)
+        self._buf_fb.fill_rect(0, 0, n, 1, self._to_be16(color))
+        self._buf_len = n * _PIXEL_LEN
 
+    def _span(self, x, y, width, height):
+        """Fills a rectangle with the color prepared by _fill_buf()."""
+        x1 = min(x + width, self._clip_x1)
+        y1 = min(y + height, self._clip_y1)
+        x, y = max(x, self._clip_x0), max(y, self._clip_y0)
+        if x >= x1 or y >= y1:
+            return
+        width, height = x1 - x, y1 - y
+
+        buf_len = self._buf_len
+        if self._rgb444:
+            size = (width * height * 3 + 1) // 2
+        else:
+            size = width * height * _PIXEL_LEN
+        chunks = size // buf_len
+        rest = size % buf_len
         self.set_window(x, y, x + width - 1, y + height - 1)
         if chunks:
+            buf = self.buf if buf_len == len(self.buf) else self.buf[:buf_len]
             for _ in range(chunks):
-                self.write(None, self.buf)
+                self._data(buf)
         if rest:
-            self.write(None, self.buf[:rest])
+            self._data(self.buf[:rest])
+        self.cs_high()
+
+    def fill_rect(self, x, y, width, height, color):
+        if (x >= self._clip_x1 or y >= self._clip_y1 or
+                x + width <= self._clip_x0 or y + height <= self._clip_y0):
+            return
+        self._fill_buf(color, width * height)
+        self._span(x, y, width, height)
 
     def fill(self, color):
         self.fill_rect(0, 0, self.width, self.height, color)
 
-    def line(self, x0, y0, x1, y1, color):
-        # Line drawing function.  Will draw a single pixel wide line starting at
-        # x0, y0 and ending at x1, y1.
+    def _gradient(self, n, c0, c1):
+        """
+        Returns n pixels fading from c0 to c1, cached for reuse. The buffer is
+        refilled in place and only reallocated when it needs to grow.
+        """
+        key = (n, c0, c1)
+        if self._grad_key != key:
+            size = n * _PIXEL_LEN
+            if self._grad is None or len(self._grad) < size:
+                self._grad = bytearray(size)
+            self._grad_view = memoryview(self._grad)[:size]
+            colors.gradient(self._grad_view, c0, c1)
+            self._grad_key = key
+        return self._grad_view
+
+    def fill_gradient(self, x, y, width, height, c0, c1, vertical=False):
+        """
+        Fills a rectangle with a linear gradient from c0 on the left to c1 on
+        the right, or from c0 at the top to c1 at the bottom if vertical is
+        set. The gradient is only computed once and then repeated for each
+        row or column.
+        """
+        if (x >= self._clip_x1 or y >= self._clip_y1 or
+                x + width <= self._clip_x0 or y + height <= self._clip_y0):
+            return
+        if vertical:
+            grad = self._gradient(height, c0, c1)
+            # consecutive rows of the same color are filled as one span
+            start = 0
+            for i in range(1, height + 1):
+                if (i == height or grad[2 * i] != grad[2 * start] or
+                        grad[2 * i + 1] != grad[2 * start + 1]):
+                    color = grad[2 * start] << 8 | grad[2 * start + 1]
+                    self._fill_buf(color, width * (i - start))
+                    self._span(x, y + start, width, i - start)
+                    start = i
+            return
+
+        x0, y0 = max(x, self._clip_x0), max(y, self._clip_y0)
+        x1 = min(x + width, self._clip_x1)
+        y1 = min(y + height, self._clip_y1)
+        row = memoryview(self._gradient(width, c0, c1))[
+            (x0 - x) * _PIXEL_LEN:(x1 - x) * _PIXEL_LEN]
+        row_len = len(row)
+        rows = y1 - y0
+        self.set_window(x0, y0, x1 - 1, y1 - 1)
+        # repeat the row in the shared buffer to send several rows at once,
+        # in 12-bit mode the buffer is needed for the conversion
+        per_chunk = 0 if self._rgb444 else min(rows, len(self.buf) // row_len)
+        if per_chunk:
+            buf = self.buf
+            for i in range(per_chunk):
+                buf[i * row_len:(i + 1) * row_len] = row
+            chunk = buf[:per_chunk * row_len]
+            for _ in range(rows // per_chunk):
+                self._data(chunk)
+            if rows % per_chunk:
+                self._data(buf[:rows % per_chunk * row_len])
+        else:
+            for _ in range(rows):
+                self._data565(row)
+        self._end()
+
+    def _line(self, x0, y0, x1, y1):
+        # Bresenham line drawing, but instead of setting each pixel
+        # individually, consecutive pixels on the same row (or column for
+        # steep lines) are sent as a single span.
+        if (min(x0, x1) >= self._clip_x1 or max(x0, x1) < self._clip_x0 or
+                min(y0, y1) >= self._clip_y1 or max(y0, y1) < self._clip_y0):
+            return
         steep = abs(y1 - y0) > abs(x1 - x0)
-        pixel = self._encode_pixel(color)
         if steep:
             x0, y0 = y0, x0
             x1, y1 = y1, x1
@@ -299,27 +1082,350 @@ class ST7789:
             ystep = 1
         else:
             ystep = -1
+        start = x0
         while x0 <= x1:
-            if steep:
-                self.set_window(y0, x0, y0, x0)
-                self.write(None, pixel)
-            else:
-                self.set_window(x0, y0, x0, y0)
-                self.write(None, pixel)
             err -= dy
-            if err < 0:
-                y0 += ystep
-                err += dx
+            if err < 0 or x0 == x1:
+                if steep:
+                    self._span(y0, start, 1, x0 - start + 1)
+                else:
+                    self._span(start, y0, x0 - start + 1, 1)
+                start = x0 + 1
+                if err < 0:
+                    y0 += ystep
+                    err += dx
             x0 += 1
 
-    def text(self, s, x, y, fg, bg):
-        text_width = len(s) * _FONT_WIDTH
-        text_mem = text_width * _FONT_HEIGHT * _PIXEL_LEN
-        if text_mem > len(self.buf):
-            raise ValueError("buffer too small")
+    def line(self, x0, y0, x1, y1, color):
+        # Line drawing function.  Will draw a single pixel wide line starting at
+        # x0, y0 and ending at x1, y1.
+        self._fill_buf(color, max(abs(x1 - x0), abs(y1 - y0)) + 1)
+        self._line(x0, y0, x1, y1)
+
+    def polyline(self, coords, color):
+        """
+        Draws connected lines through all points in coords, which is a flat
+        sequence of coordinates in the form of [x0, y0, x1, y1, x2, y2, ...]
+        """
+        self._fill_buf(color, len(self.buf))
+        for i in range(2, len(coords) - 1, 2):
+            self._line(coords[i - 2], coords[i - 1], coords[i], coords[i + 1])
+
+    def lines(self, coords, color):
+        """
+        Draws independent lines from a flat sequence of coordinates in the
+        form of [x0, y0, x1, y1, x0, y0, x1, y1, ...] with four values per line
+        """
+        self._fill_buf(color, len(self.buf))
+        for i in range(0, len(coords) - 3, 4):
+            self._line(coords[i], coords[i + 1], coords[i + 2], coords[i + 3])
+
+    def _quadrants(self, cx0, cy0, cx1, cy1, r):
+        """
+        Draws the outline of four circle quadrants with radius r. The left
+        quadrants are centered at cx0, the right ones at cx1, the upper ones
+        at cy0 and the lower ones at cy1.
+        """
+        # midpoint circle algorithm for the octant with x <= y. Pixels with
+        # the same y form a horizontal run, which in the mirrored octants
+        # turns into a vertical one.
+        x, y = 0, r
+        d = 1 - r
+        start = 0
+        while x <= y:
+            if d < 0:
+                d += 2 * x + 3
+                nx, ny = x + 1, y
+            else:
+                d += 2 * (x - y) + 5
+                nx, ny = x + 1, y - 1
+            if ny != y or nx > ny:
+                n = x - start + 1
+                self._span(cx0 - x, cy0 - y, n, 1)
+                self._span(cx1 + start, cy0 - y, n, 1)
+                self._span(cx0 - x, cy1 + y, n, 1)
+                self._span(cx1 + start, cy1 + y, n, 1)
+                self._span(cx0 - y, cy0 - x, 1, n)
+                self._span(cx1 + y, cy0 - x, 1, n)
+                self._span(cx0 - y, cy1 + start, 1, n)
+                self._span(cx1 + y, cy1 + start, 1, n)
+                start = nx
+            x, y = nx, ny
 
-        f = framebuf.FrameBuffer(self.buf, text_width,
-                                 _FONT_HEIGHT, framebuf.RGB565)
+    def _fill_quadrants(self, cx0, cy0, cx1, cy1, r):
+        """Fills four circle quadrants, see _quadrants() for the arguments."""
+        x, y = 0, r
+        d = 1 - r
+        start = 0
+        while x <= y:
+            if d < 0:
+                d += 2 * x + 3
+                nx, ny = x + 1, y
+            else:
+                d += 2 * (x - y) + 5
+                nx, ny = x + 1, y - 1
+            # each x is the distance of a row to the center, spanning up to y
+            self._span(cx0 - y, cy0 - x, cx1 - cx0 + 2 * y + 1, 1)
+            if x or cy0 != cy1:
+                self._span(cx0 - y, cy1 + x, cx1 - cx0 + 2 * y + 1, 1)
+            # rows at distance y are only complete at the end of the run and
+            # already covered above if the run ends on the diagonal
+            if (ny != y or nx > ny) and x < y:
+                self._span(cx0 - x, cy0 - y, cx1 - cx0 + 2 * x + 1, 1)
+                self._span(cx0 - x, cy1 + y, cx1 - cx0 + 2 * x + 1, 1)
+            x, y = nx, ny
+
+    def circle(self, x, y, r, color):
+        self._fill_buf(color, r + 1)
+        self._quadrants(x, y, x, y, r)
+
+    def fill_circle(self, x, y, r, color):
+        self._fill_buf(color, 2 * r + 1)
+        self._fill_quadrants(x, y, x, y, r)
+
+    def round_rect(self, x, y, w, h, r, color):
+        r = min(r, w // 2, h // 2)
+        self._fill_buf(color, max(w, h))
+        self._span(x + r, y, w - 2 * r, 1)
+        self._span(x + r, y + h - 1, w - 2 * r, 1)
+        self._span(x, y + r, 1, h - 2 * r)
+        self._span(x + w - 1, y + r, 1, h - 2 * r)
+        self._quadrants(x + r, y + r, x + w - r - 1, y + h - r - 1, r)
+
+    def fill_round_rect(self, x, y, w, h, r, color):
+        r = min(r, w // 2, h // 2)
+        self._fill_buf(color, w * max(h - 2 * r, 1))
+        self._span(x, y + r, w, h - 2 * r)
+        self._fill_quadrants(x + r, y + r, x + w - r - 1, y + h - r - 1, r)
+
+    def triangle(self, x0, y0, x1, y1, x2, y2, color):
+        self._fill_buf(color, len(self.buf))
+        self._line(x0, y0, x1, y1)
+        self._line(x1, y1, x2, y2)
+        self._line(x2, y2, x0, y0)
+
+    def fill_triangle(self, x0, y0, x1, y1, x2, y2, color):
+        # sort the vertices by y, so y0 <= y1 <= y2
+        if y0 > y1:
+            x0, y0, x1, y1 = x1, y1, x0, y0
+        if y1 > y2:
+            x1, y1, x2, y2 = x2, y2, x1, y1
+        if y0 > y1:
+            x0, y0, x1, y1 = x1, y1, x0, y0
+        self._fill_buf(color, max(x0, x1, x2) - min(x0, x1, x2) + 1)
+
+        if y0 == y2:
+            a = min(x0, x1, x2)
+            self._span(a, y0, max(x0, x1, x2) - a + 1, 1)
+            return
+
+        # each row is a span between the long edge (0-2) and either the
+        # upper (0-1) or the lower (1-2) short edge
+        dx01, dy01 = x1 - x0, y1 - y0
+        dx02, dy02 = x2 - x0, y2 - y0
+        dx12, dy12 = x2 - x1, y2 - y1
+        # include the middle row in the upper half only if it is flat
+        last = y1 if y1 == y2 else y1 - 1
+        sa = sb = 0
+        for y in range(y0, last + 1):
+            a = x0 + sa // dy01
+            b = x0 + sb // dy02
+            sa += dx01
+            sb += dx02
+            if a > b:
+                a, b = b, a
+            self._span(a, y, b - a + 1, 1)
+        sa = dx12 * (last + 1 - y1)
+        sb = dx02 * (last + 1 - y0)
+        for y in range(last + 1, y2 + 1):
+            a = x1 + sa // dy12
+            b = x0 + sb // dy02
+            sa += dx12
+            sb += dx02
+            if a > b:
+                a, b = b, a
+            self._span(a, y, b - a + 1, 1)
+
+    def _arc_row(self, x, y, dy, a, b, sector):
+        """Draws the part of the row segment [a, b] lying within sector."""
+        if sector is None:
+            self._span(x + a, y + dy, b - a + 1, 1)
+            return
+        ux, uy, vx, vy, invert = sector
+        # points p within the sector satisfy cross(u, p) >= 0 and
+        # cross(p, v) >= 0, each of which bounds x on one side
+        lo, hi = float(a), float(b)
+        if uy > 0:
+            hi = min(hi, ux * dy / uy)
+        elif uy < 0:
+            lo = max(lo, ux * dy / uy)
+        elif ux * dy < 0:
+            hi = lo - 1
+        if vy > 0:
+            lo = max(lo, vx * dy / vy)
+        elif vy < 0:
+            hi = min(hi, vx * dy / vy)
+        elif vx * dy > 0:
+            hi = lo - 1
+        lo, hi = round(lo), round(hi)
+        if not invert:
+            if lo <= hi:
+                self._span(x + lo, y + dy, hi - lo + 1, 1)
+        elif lo > hi:
+            self._span(x + a, y + dy, b - a + 1, 1)
+        else:
+            if lo > a:
+                self._span(x + a, y + dy, min(lo - 1, b) - a + 1, 1)
+            if hi < b:
+                hi = max(hi + 1, a)
+                self._span(x + hi, y + dy, b - hi + 1, 1)
+
+    def arc(self, x, y, r, start, end, color, width=1):
+        """
+        Draws an arc of the given width around the center x, y with the
+        outer radius r. The arc runs clockwise from the start to the end
+        angle, in degrees, with 0 pointing to the right.
+        """
+        span = (end - start) % 360
+        if span == 0 and end != start:
+            span = 360
+        if span == 0:
+            return
+        sector = None
+        if span < 360:
+            # sectors larger than a half circle are drawn as the inverse of
+            # the remaining sector, so the sector is always convex
+            invert = span > 180
+            if invert:
+                start, end = end, start
+            a, b = radians(start), radians(end)
+            sector = (cos(a), sin(a), cos(b), sin(b), invert)
+
+        inner = r - width
+        self._fill_buf(color, 2 * r + 1)
+        for dy in range(-r, r + 1):
+            outer = int(sqrt(r * r + r - dy * dy))
+            if inner < 0 or dy * dy > inner * inner + inner:
+                self._arc_row(x, y, dy, -outer, outer, sector)
+            else:
+                hole = int(sqrt(inner * inner + inner - dy * dy))
+                self._arc_row(x, y, dy, -outer, -hole - 1, sector)
+                self._arc_row(x, y, dy, hole + 1, outer, sector)
+
+    def _render_glyph(self, ch, font, scale, fg, bg):
+        """
+        Renders a single character into an RGB565 buffer, reusing a buffer
+        evicted from the glyph cache if possible.
+        """
+        if font is None:
+            w, h = _FONT_WIDTH, _FONT_HEIGHT
+            bitmap = bytearray(_FONT_HEIGHT)
+            framebuf.FrameBuffer(bitmap, w, h, framebuf.MONO_HLSB).text(
+                ch, 0, 0, 1)
+        else:
+            w, h = font.WIDTH, font.HEIGHT
+            bitmap = None
+            code = ord(ch)
+            if font.FIRST <= code <= font.LAST:
+                size = (w + 7) // 8 * h
+                offset = (code - font.FIRST) * size
+                bitmap = font.FONT[offset:offset + size]
+
+        gw, gh = w * scale, h * scale
+        glyph = self.glyphs.alloc(gw * gh * _PIXEL_LEN)
+        f = framebuf.FrameBuffer(glyph, gw, gh, framebuf.RGB565)
         f.fill(self._to_be16(bg))
-        f.text(s, 0, 0, self._to_be16(fg))
-        self.blit_buffer(self.buf[:text_mem], x, y, text_width, _FONT_HEIGHT)
+        if bitmap is not None:
+            fg = self._to_be16(fg)
+            row_bytes = (w + 7) // 8
+            for row in range(h):
+                for col in range(w):
+                    if bitmap[row * row_bytes + col // 8] & (0x80 >> col % 8):
+                        f.fill_rect(col * scale, row * scale, scale, scale, fg)
+        return glyph
+
+    def _glyph(self, ch, font, scale, fg, bg):
+        key = (font, scale, fg, bg, ch)
+        glyph = self.glyphs.get(key)
+        if glyph is None:
+            glyph = self._render_glyph(ch, font, scale, fg, bg)
+            self.glyphs.put(key, glyph)
+        return glyph
+
+    def text(self, s, x, y, fg, bg, font=None, scale=1):
+        """
+        Draws the string s at the given position. The built-in 8x8 font is
+        used if no font is given. Otherwise font must provide the glyph bitmaps
+        in horizontal, MSB-first byte order through the following attributes:
+
+          - WIDTH and HEIGHT: size of a glyph in pixels
+          - FIRST and LAST: character codes of the first and last glyph
+          - FONT: the bitmaps of all glyphs, each row padded to full bytes
+
+        Glyphs may be enlarged by an integer scale factor. Strings of any
+        length are drawn in chunks which fit into the shared buffer.
+
+        Except for the built-in font at scale 1, rendered glyphs are kept in
+        a cache of at most glyph_cache bytes (a constructor argument). Each
+        glyph takes width * height * scale**2 * 2 bytes, e.g. 512 bytes for
+        the built-in font at scale 2, so the default of 6KB holds the digits
+        and a separator at scale 2. Larger scales or more distinct characters
+        need a larger cache to avoid re-rendering, at the cost of heap.
+        """
+        if font is None:
+            w, h = _FONT_WIDTH, _FONT_HEIGHT
+        else:
+            w, h = font.WIDTH, font.HEIGHT
+        gw, gh = w * scale, h * scale
+        if (x >= self._clip_x1 or y >= self._clip_y1 or
+                x + len(s) * gw <= self._clip_x0 or y + gh <= self._clip_y0):
+            return
+        glyph_mem = gw * gh * _PIXEL_LEN
+        per_chunk = len(self.buf) // glyph_mem
+
+        if font is None and scale == 1 and per_chunk:
+            # framebuf renders the built-in font faster than we can copy
+            # cached glyphs, so skip the cache in this case
+            fg, bg = self._to_be16(fg), self._to_be16(bg)
+            for i in range(0, len(s), per_chunk):
+                chunk = s[i:i + per_chunk]
+                text_width = len(chunk) * _FONT_WIDTH
+                cx = x + i * _FONT_WIDTH
+                if cx >= self._clip_x1 or cx + text_width <= self._clip_x0:
+                    continue
+                f = framebuf.FrameBuffer(self.buf, text_width,
+                                         _FONT_HEIGHT, framebuf.RGB565)
+                f.fill(bg)
+                f.text(chunk, 0, 0, fg)
+                self.blit_buffer(self.buf[:text_width * _FONT_HEIGHT *
+                                          _PIXEL_LEN],
+                                 cx, y, text_width, _FONT_HEIGHT)
+            return
+
+        if not per_chunk:
+            # glyphs do not fit into the buffer, send them one by one
+            for ch in s:
+                if self._clip_x0 - gw < x < self._clip_x1:
+                    self.blit_buffer(self._glyph(ch, font, scale, fg, bg),
+                                     x, y, gw, gh)
+                x += gw
+            return
+
+        row_len = gw * _PIXEL_LEN
+        buf = self.buf
+        for i in range(0, len(s), per_chunk):
+            chunk = s[i:i + per_chunk]
+            stride = len(chunk) * row_len
+            cx = x + i * gw
+            if cx >= self._clip_x1 or cx + len(chunk) * gw <= self._clip_x0:
+                continue
+            # place the glyphs next to each other in the shared buffer
+            for j in range(len(chunk)):
+                glyph = memoryview(self._glyph(chunk[j], font, scale, fg, bg))
+                dst = j * row_len
+                src = 0
+                for _ in range(gh):
+                    buf[dst:dst + row_len] = glyph[src:src + row_len]
+                    dst += stride
+                    src += row_len
+            self.blit_buffer(buf[:stride * gh], cx, y, len(chunk) * gw, gh)
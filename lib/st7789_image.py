@@ -0,0 +1,245 @@
+# Copyright (c) 2020 Sebastian Wicki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Streaming image loader for the ST7789 driver. Images are read from the file
+system in chunks into the shared buffer of the driver and sent to the display
+right away, so the image never has to be held in memory as a whole.
+"""
+from micropython import const
+from ustruct import unpack_from
+
+import colors
+
+_BMP_HEADER_LEN = const(66)  # file header, info header and bitfield masks
+
+_BI_RGB = const(0)
+_BI_RLE8 = const(1)
+_BI_RLE4 = const(2)
+_BI_BITFIELDS = const(3)
+
+_RLE_READ_LEN = const(64)
+
+
+def blit_raw(tft, path, x, y, width, height):
+    """
+    Draws an image file consisting of width * height big-endian RGB565
+    pixels without any header at the given position.
+    """
+    buf = tft.buf
+    row_len = width * 2
+    rows = len(buf) // row_len
+    if not rows:
+        raise ValueError("buffer too small")
+    with open(path, "rb") as f:
+        for row in range(0, height, rows):
+            rows = min(rows, height - row)
+            chunk = buf[:rows * row_len]
+            if f.readinto(chunk) != len(chunk):
+                raise ValueError("invalid image")
+            tft.blit_buffer(chunk, x, y + row, width, rows)
+
+
+def _rgb565(b, g, r):
+    return (r & 0xf8) << 8 | (g & 0xfc) << 3 | b >> 3
+
+
+def _convert_16bit(buf, base, width, rgb555):
+    # little-endian RGB565 or RGB555 to big-endian RGB565
+    src = base
+    dst = 0
+    for _ in range(width):
+        c = buf[src] | buf[src + 1] << 8
+        if rgb555:
+            c = (c & 0x7fe0) << 1 | (c & 0x0200) >> 4 | (c & 0x001f)
+        buf[dst] = c >> 8
+        buf[dst + 1] = c & 0xff
+        src += 2
+        dst += 2
+
+
+def _convert_indexed(buf, base, width, bpp, palette):
+    mask = (1 << bpp) - 1
+    dst = 0
+    for i in range(width):
+        bit = i * bpp
+        c = palette[(buf[base + (bit >> 3)] >> (8 - bpp - (bit & 7))) & mask]
+        buf[dst] = c >> 8
+        buf[dst + 1] = c & 0xff
+        dst += 2
+
+
+class _Reader:
+    """Buffered byte reader for decoding run-length encoded bitmaps."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = bytearray(_RLE_READ_LEN)
+        self.pos = 0
+        self.len = 0
+
+    def byte(self):
+        if self.pos >= self.len:
+            self.len = self.f.readinto(self.buf)
+            self.pos = 0
+            if not self.len:
+                raise ValueError("invalid image")
+        self.pos += 1
+        return self.buf[self.pos - 1]
+
+
+def _fill_row(buf, out_len, color):
+    for i in range(0, out_len, 2):
+        buf[i] = color >> 8
+        buf[i + 1] = color & 0xff
+
+
+def _blit_rle(tft, f, x, y, width, height, bpp, palette):
+    buf = tft.buf
+    out_len = width * 2
+    if out_len > len(buf):
+        raise ValueError("buffer too small")
+    reader = _Reader(f)
+    # skipped pixels are filled with the first palette entry
+    bg = palette[0]
+    _fill_row(buf, out_len, bg)
+    row = height - 1  # run-length encoded bitmaps are always bottom-up
+    col = 0
+    while row >= 0:
+        count = reader.byte()
+        value = reader.byte()
+        if count:
+            # encoded run, RLE4 alternates between the two nibbles
+            for i in range(count):
+                if bpp == 4:
+                    c = value >> 4 if i & 1 == 0 else value & 0x0f
+                else:
+                    c = value
+                if col < width:
+                    c = palette[c]
+                    buf[col * 2] = c >> 8
+                    buf[col * 2 + 1] = c & 0xff
+                col += 1
+        elif value >= 3:
+            # absolute run, padded to 16 bits
+            n = value if bpp == 8 else (value + 1) // 2
+            for i in range(value):
+                if bpp == 4:
+                    if i & 1 == 0:
+                        b = reader.byte()
+                        c = b >> 4
+                    else:
+                        c = b & 0x0f
+                else:
+                    c = reader.byte()
+                if col < width:
+                    c = palette[c]
+                    buf[col * 2] = c >> 8
+                    buf[col * 2 + 1] = c & 0xff
+                col += 1
+            if n & 1:
+                reader.byte()
+        elif value == 2:
+            # delta, moves right and down while keeping the column
+            col += reader.byte()
+            dy = reader.byte()
+            if dy:
+                tft.blit_buffer(buf[:out_len], x, y + row, width, 1)
+                _fill_row(buf, out_len, bg)
+                for _ in range(dy - 1):
+                    row -= 1
+                    if row >= 0:
+                        tft.blit_buffer(buf[:out_len], x, y + row, width, 1)
+                row -= 1
+        else:
+            # end of line or end of bitmap
+            tft.blit_buffer(buf[:out_len], x, y + row, width, 1)
+            _fill_row(buf, out_len, bg)
+            col = 0
+            row -= 1
+            if value == 1:
+                # the rows not encoded get the first palette entry as well
+                for row in range(row, -1, -1):
+                    tft.blit_buffer(buf[:out_len], x, y + row, width, 1)
+                break
+
+
+def blit_bmp(tft, path, x, y):
+    """
+    Draws a BMP image file at the given position. Supported are 24-bit and
+    16-bit (RGB555 and RGB565) as well as palette-indexed bitmaps with 1, 4
+    or 8 bits per pixel, optionally run-length encoded (RLE4 and RLE8).
+    Returns the width and height of the image.
+    """
+    with open(path, "rb") as f:
+        hdr = f.read(_BMP_HEADER_LEN)
+        if hdr[:2] != b"BM":
+            raise ValueError("invalid image")
+        offset, dib_len, width, height, _, bpp, compression = unpack_from(
+            "<IIiiHHI", hdr, 10)
+        top_down = height < 0
+        height = abs(height)
+
+        if not (compression == _BI_RGB and bpp in (1, 4, 8, 16, 24) or
+                compression == _BI_RLE8 and bpp == 8 or
+                compression == _BI_RLE4 and bpp == 4 or
+                compression == _BI_BITFIELDS and bpp == 16):
+            raise ValueError("unsupported image")
+
+        rgb555 = True
+        if compression == _BI_BITFIELDS:
+            _, green, _ = unpack_from("<III", hdr, 54)
+            rgb555 = green != 0x07e0
+
+        palette = None
+        if bpp <= 8:
+            n = unpack_from("<I", hdr, 46)[0] if dib_len >= 40 else 0
+            f.seek(14 + dib_len)
+            raw = f.read(4 * (n or 1 << bpp))
+            palette = [_rgb565(raw[i], raw[i + 1], raw[i + 2])
+                       for i in range(0, len(raw), 4)]
+
+        f.seek(offset)
+        if compression in (_BI_RLE8, _BI_RLE4):
+            _blit_rle(tft, f, x, y, width, height, bpp, palette)
+            return width, height
+
+        buf = tft.buf
+        row_bytes = (width * bpp + 31) // 32 * 4
+        out_len = width * 2
+        # rows are read into the end of the buffer and converted to the start
+        base = len(buf) - row_bytes
+        if base < 0 or out_len > len(buf) or (
+                bpp < 16 and 2 * width - 3 >= base + (width - 1) * bpp // 8):
+            raise ValueError("buffer too small")
+        src = buf[base:]
+        for i in range(height):
+            if f.readinto(src) != row_bytes:
+                raise ValueError("invalid image")
+            if bpp == 24:
+                # the output never overtakes the input
+                colors.rgb888_to_rgb565(buf[base:base + width * 3], buf,
+                                        bgr=True)
+            elif bpp == 16:
+                _convert_16bit(buf, base, width, rgb555)
+            else:
+                _convert_indexed(buf, base, width, bpp, palette)
+            row = i if top_down else height - 1 - i
+            tft.blit_buffer(buf[:out_len], x, y + row, width, 1)
+    return width, height
@@ -0,0 +1,113 @@
+# Copyright (c) 2020 Sebastian Wicki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Power state machine for the ST7789 display, dimming the backlight and putting
+the panel to sleep after periods of inactivity.
+"""
+from micropython import const
+from utime import sleep_ms, ticks_diff, ticks_ms
+
+STATE_ON = const(0)
+STATE_DIM = const(1)
+STATE_SLEEP = const(2)
+
+# time the panel needs after leaving sleep mode before accepting commands
+_WAKE_MS = const(10)
+
+
+class DisplayPower:
+    def __init__(self, tft, pmu=None, dim_after=10000, sleep_after=60000,
+                 bright=3.0, dim=2.5, band=None, idle=True):
+        """
+        Manages the power state of the display. After dim_after milliseconds
+        without activity, the backlight is set to the dim voltage and the
+        panel enters idle mode (if idle is set) and partial mode limited to
+        band, a (y, height) tuple, if given. After sleep_after milliseconds,
+        the backlight is switched off and the panel is put to sleep. A timeout
+        of zero disables the respective state.
+
+        pmu is an axp192.AXP192 instance, the backlight is left alone if None.
+        bright and dim are the LDO2 voltages used in the on and dim states.
+        """
+        self.tft = tft
+        self.pmu = pmu
+        self.dim_after = dim_after
+        self.sleep_after = sleep_after
+        self.bright = bright
+        self.dim = dim
+        self.band = band
+        self.idle = idle
+        self.state = STATE_ON
+        self.last = ticks_ms()
+        if pmu is not None:
+            pmu.set_ldo2_voltage(bright)
+
+    def activity(self):
+        """
+        Restarts the inactivity timeouts and turns the display back on if
+        it is dimmed or asleep. Call this on user input.
+        """
+        self.last = ticks_ms()
+        if self.state != STATE_ON:
+            self._enter(STATE_ON)
+
+    def update(self):
+        """
+        Applies the timeouts, to be called periodically, e.g. from the main
+        loop. Returns the current state.
+        """
+        elapsed = ticks_diff(ticks_ms(), self.last)
+        if self.sleep_after and elapsed >= self.sleep_after:
+            state = STATE_SLEEP
+        elif self.dim_after and elapsed >= self.dim_after:
+            state = STATE_DIM
+        else:
+            state = STATE_ON
+        if state > self.state:
+            self._enter(state)
+        return self.state
+
+    def _enter(self, state):
+        tft, pmu = self.tft, self.pmu
+        if self.state == STATE_SLEEP:
+            if pmu is not None:
+                pmu.set_ldo2(True)
+            tft.sleep_mode(False)
+            sleep_ms(_WAKE_MS)
+
+        if state == STATE_ON:
+            if self.band is not None:
+                tft.normal_mode()
+            if self.idle:
+                tft.idle_mode(False)
+            if pmu is not None:
+                pmu.set_ldo2_voltage(self.bright)
+        elif state == STATE_DIM:
+            if self.band is not None:
+                tft.partial_mode(*self.band)
+            if self.idle:
+                tft.idle_mode(True)
+            if pmu is not None:
+                pmu.set_ldo2_voltage(self.dim)
+        else:
+            tft.sleep_mode(True)
+            if pmu is not None:
+                pmu.set_ldo2(False)
+        self.state = state
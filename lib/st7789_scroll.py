@@ -0,0 +1,122 @@
+# Copyright (c) 2020 Sebastian Wicki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Log console and strip chart for the ST7789 driver based on hardware scrolling.
+"""
+from micropython import const
+
+import colors
+
+_LINE_HEIGHT = const(8)
+_CHAR_WIDTH = const(8)
+
+
+class ScrollConsole:
+    def __init__(self, tft, fg=colors.WHITE, bg=colors.BLACK, top=0, bottom=0):
+        """
+        Text console occupying the screen area between top and bottom fixed
+        rows. Once the console is full, each new line scrolls the screen
+        content up in hardware and only the new line is drawn.
+        """
+        height = tft.height - top - bottom
+        if height < _LINE_HEIGHT:
+            raise ValueError("invalid argument(s) value")
+        # only whole lines are scrolled, the remaining rows stay fixed
+        tft.scroll_area(top, bottom + height % _LINE_HEIGHT)
+        self.tft = tft
+        self.fg = fg
+        self.bg = bg
+        self.top = top
+        self.lines = height // _LINE_HEIGHT
+        self.cols = tft.width // _CHAR_WIDTH
+        self.line = 0
+        self.offset = 0
+        tft.fill_rect(0, top, tft.width, self.lines * _LINE_HEIGHT, bg)
+
+    def print(self, s):
+        """
+        Prints s starting on a new line. Newlines start a new line and lines
+        longer than the console width are wrapped.
+        """
+        cols = self.cols
+        for line in s.split("\n"):
+            self._line(line[:cols])
+            for i in range(cols, len(line), cols):
+                self._line(line[i:i + cols])
+
+    def _line(self, s):
+        tft = self.tft
+        if self.line < self.lines:
+            row = self.line
+            self.line += 1
+        else:
+            self.offset = (self.offset + 1) % self.lines
+            tft.scroll(self.offset * _LINE_HEIGHT)
+            row = self.lines - 1
+        y = tft.scroll_row(self.top + row * _LINE_HEIGHT)
+
+        # pad with spaces to clear the previous content of the line
+        s += " " * (self.cols - len(s))
+        tft.text(s, 0, y, self.fg, self.bg)
+        x = self.cols * _CHAR_WIDTH
+        if x < tft.width:
+            tft.fill_rect(x, y, tft.width - x, _LINE_HEIGHT, self.bg)
+
+
+class StripChart:
+    def __init__(self, tft, lo, hi, fg=colors.GREEN, bg=colors.BLACK,
+                 top=0, bottom=0):
+        """
+        Strip chart occupying the screen area between top and bottom fixed
+        rows. Each sample scrolls the chart up by one row and is drawn as
+        a horizontal position on the new row, with lo at the left and hi at
+        the right edge of the screen.
+        """
+        if hi <= lo:
+            raise ValueError("invalid argument(s) value")
+        tft.scroll_area(top, bottom)
+        self.tft = tft
+        self.lo = lo
+        self.hi = hi
+        self.fg = fg
+        self.bg = bg
+        self.top = top
+        self.rows = tft.height - top - bottom
+        self.offset = 0
+        self.x = -1
+        tft.fill_rect(0, top, tft.width, self.rows, bg)
+
+    def add(self, value):
+        """Adds a sample to the bottom of the chart."""
+        tft = self.tft
+        width = tft.width
+        x = int((value - self.lo) * (width - 1) / (self.hi - self.lo))
+        x = min(max(x, 0), width - 1)
+
+        self.offset = (self.offset + 1) % self.rows
+        tft.scroll(self.offset)
+        y = tft.scroll_row(self.top + self.rows - 1)
+
+        # connect to the previous sample so the trace stays continuous
+        prev = x if self.x < 0 else self.x
+        x0, x1 = min(prev, x), max(prev, x)
+        tft.hline(0, y, width, self.bg)
+        tft.hline(x0, y, x1 - x0 + 1, self.fg)
+        self.x = x
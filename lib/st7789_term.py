@@ -0,0 +1,199 @@
+# Copyright (c) 2020 Sebastian Wicki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Character-cell terminal for the ST7789 driver. The screen content is kept in
+a grid of characters and color attributes and only the cells which changed
+since the last refresh are redrawn.
+"""
+from micropython import const
+
+import colors
+
+_FONT_WIDTH = const(8)
+_FONT_HEIGHT = const(8)
+
+# number of unchanged cells which are redrawn to merge two changed runs
+_MERGE_GAP = const(3)
+
+PALETTE = (colors.BLACK, colors.BLUE, colors.RED, colors.GREEN,
+           colors.CYAN, colors.MAGENTA, colors.YELLOW, colors.WHITE)
+
+
+class Terminal:
+    def __init__(self, tft, x=0, y=0, cols=None, rows=None, font=None,
+                 scale=1, palette=PALETTE, fg=7, bg=0):
+        """
+        Terminal occupying cols x rows character cells starting at x, y. By
+        default, it covers the remaining screen area. font and scale are
+        passed on to ST7789.text(). Colors are given as indices into palette,
+        a sequence of up to 16 RGB565 colors.
+        """
+        if font is None:
+            w, h = _FONT_WIDTH, _FONT_HEIGHT
+        else:
+            w, h = font.WIDTH, font.HEIGHT
+        self.cw = w * scale
+        self.ch = h * scale
+        if cols is None:
+            cols = (tft.width - x) // self.cw
+        if rows is None:
+            rows = (tft.height - y) // self.ch
+        if cols <= 0 or rows <= 0 or len(palette) > 16:
+            raise ValueError("invalid argument(s) value")
+        self.tft = tft
+        self.x = x
+        self.y = y
+        self.cols = cols
+        self.rows = rows
+        self.font = font
+        self.scale = scale
+        self.palette = palette
+        self.attr = fg << 4 | bg
+        self.col = 0
+        self.row = 0
+        self.wrap = True
+        self.cursor = False
+
+        # each cell has a character and an attribute byte with the foreground
+        # color index in the upper and the background index in the lower half
+        n = cols * rows
+        self.chars = bytearray(b" " * n)
+        self.attrs = bytearray(bytes((self.attr,)) * n)
+        # what is currently shown on the display
+        self._chars = bytearray(self.chars)
+        self._attrs = bytearray(self.attrs)
+        tft.fill_rect(x, y, cols * self.cw, rows * self.ch, palette[bg])
+
+    def color(self, fg, bg=None):
+        """Sets the colors used for the following characters."""
+        if bg is None:
+            bg = self.attr & 0x0f
+        self.attr = fg << 4 | bg
+
+    def move(self, col, row):
+        """Moves the cursor, the position is clamped to the terminal size."""
+        self.col = min(max(col, 0), self.cols - 1)
+        self.row = min(max(row, 0), self.rows - 1)
+
+    def clear(self):
+        """Clears the terminal with the current colors and homes the cursor."""
+        n = self.cols * self.rows
+        self.chars[:] = b" " * n
+        self.attrs[:] = bytes((self.attr,)) * n
+        self.col = self.row = 0
+
+    def clear_eol(self):
+        """Clears from the cursor to the end of the line."""
+        start = self.row * self.cols + min(self.col, self.cols)
+        end = (self.row + 1) * self.cols
+        self.chars[start:end] = b" " * (end - start)
+        self.attrs[start:end] = bytes((self.attr,)) * (end - start)
+
+    def scroll(self):
+        """Moves all lines up by one and clears the last line."""
+        cols = self.cols
+        n = cols * (self.rows - 1)
+        self.chars[:n] = self.chars[cols:]
+        self.attrs[:n] = self.attrs[cols:]
+        self.chars[n:] = b" " * cols
+        self.attrs[n:] = bytes((self.attr,)) * cols
+
+    def _newline(self):
+        self.col = 0
+        if self.row + 1 < self.rows:
+            self.row += 1
+        else:
+            self.scroll()
+
+    def write(self, s):
+        """
+        Writes s at the cursor position. Supports newline, carriage return
+        and backspace. Characters beyond the last column wrap to the next
+        line if wrap is set and are dropped otherwise. Characters outside of
+        printable ASCII are replaced with "?". Call refresh() to show them.
+        """
+        cols = self.cols
+        chars, attrs, attr = self.chars, self.attrs, self.attr
+        for ch in s:
+            c = ord(ch)
+            if c == 0x0a:
+                self._newline()
+            elif c == 0x0d:
+                self.col = 0
+            elif c == 0x08:
+                self.col = max(min(self.col, cols) - 1, 0)
+            else:
+                if self.col >= cols:
+                    if not self.wrap:
+                        continue
+                    self._newline()
+                i = self.row * cols + self.col
+                chars[i] = c if 0x20 <= c < 0x7f else 0x3f
+                attrs[i] = attr
+                self.col += 1
+
+    def refresh(self):
+        """
+        Redraws the cells which changed since the last refresh. Changed cells
+        with the same colors on a row are drawn with a single call to
+        ST7789.text() if at most a few unchanged cells lie between them. If
+        cursor is set, the cursor cell is drawn with the
+        colors swapped.
+        """
+        tft, pal = self.tft, self.palette
+        cols, cw, ch = self.cols, self.cw, self.ch
+        chars, attrs = self.chars, self.attrs
+        shown_chars, shown_attrs = self._chars, self._attrs
+        cur = -1
+        if self.cursor:
+            cur = self.row * cols + min(self.col, cols - 1)
+
+        for row in range(self.rows):
+            i = row * cols
+            end = i + cols
+            while i < end:
+                a = attrs[i]
+                if i == cur:
+                    a = (a & 0x0f) << 4 | a >> 4
+                if chars[i] == shown_chars[i] and a == shown_attrs[i]:
+                    i += 1
+                    continue
+
+                # extend the run, bridging short gaps of unchanged cells
+                start = last = i
+                i += 1
+                while i < end:
+                    b = attrs[i]
+                    if i == cur:
+                        b = (b & 0x0f) << 4 | b >> 4
+                    if b != a:
+                        break
+                    if chars[i] != shown_chars[i] or b != shown_attrs[i]:
+                        last = i
+                    elif i - last > _MERGE_GAP:
+                        break
+                    i += 1
+                i = last + 1
+                shown_chars[start:i] = chars[start:i]
+                for j in range(start, i):
+                    shown_attrs[j] = a
+                tft.text(str(chars[start:i], "ascii"),
+                         self.x + (start - row * cols) * cw, self.y + row * ch,
+                         pal[a >> 4], pal[a & 0x0f], self.font, self.scale)